@@ -1,9 +1,19 @@
 import os
+import re
+import asyncio
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import AsyncIterator, Iterator, List
 from dotenv import load_dotenv
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import FAISS
+from langchain_openai import ChatOpenAI
+from vector_cache import vector_cache, index_version
+from kb_store import load_store
+from index_factory import reduce_dimensions
+from index_registry import registry
+from embedding_cache import build_embeddings
+from answer_cache import answer_cache, prompt_hash
+from bm25_index import BM25Index, BM25_FILE, reciprocal_rank_fusion
+from summarizer import Summarizer
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -14,14 +24,19 @@ if not api_key:
 else:
     logger.info("OpenAI API key loaded successfully")
 
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small",
-    api_key=api_key,
-    base_url="https://api.proxyapi.ru/openai/v1"
-) if api_key else None
+embeddings = build_embeddings(api_key) if api_key else None
+
+# Chunks passed to the model, and candidates taken from each retriever before fusion
+RETRIEVAL_K = 4
+HYBRID_CANDIDATES = 10
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+# How long a confident keyword match waits for the vector side before answering alone
+RETRIEVAL_BUDGET_MS = int(os.getenv("RETRIEVAL_BUDGET_MS", "300"))
 
-prompt_template = ChatPromptTemplate.from_template(
-    """Expert Research Assistant Guidelines:
+# Question embeddings run here while the keyword search runs in the caller's thread
+_query_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+
+PROMPT_TEMPLATE = """Expert Research Assistant Guidelines:
 
 1. Source Accuracy:
    - Strictly use ONLY the provided context
@@ -49,7 +64,20 @@ Context:
 
 Question: {question}"""
 
-)
+def build_prompt(prompt: str, question: str, context: str) -> str:
+    """
+    Fill PROMPT_TEMPLATE with the retrieved context and the question
+
+    The user's prompt (free text like "Answer in technical style") is added to the
+    template as extra instructions and never replaces it. Placeholders are
+    substituted in one pass, so stray braces in the prompt stay literal.
+    """
+    template = PROMPT_TEMPLATE
+    instructions = (prompt or "").strip()
+    if instructions:
+        template = template.replace("\nContext:\n", "\nUser Instructions:\n{instructions}\n\nContext:\n", 1)
+    values = {"context": context, "question": question, "instructions": instructions}
+    return re.sub(r"\{(context|question|instructions)\}", lambda m: values[m.group(1)], template)
 
 llm = ChatOpenAI(
     model='gpt-4o-mini',
@@ -58,57 +86,227 @@ llm = ChatOpenAI(
     temperature=0.3
 ) if api_key else None
 
-def get_vector_store():
-    """Returns initialized vector store with fresh data"""
+summarizer = Summarizer(llm, model="gpt-4o-mini") if llm else None
+
+
+def _load_vector_store(folder_path: str):
+    logger.info("Loading FAISS vector store...")
+    vector_store = load_store(folder_path, embeddings)
+    logger.info("Vector store loaded successfully")
+    return vector_store
+
+def get_vector_store(chat_id=None):
+    """Returns the chat's knowledge base, served from the in-memory cache while it is unchanged"""
     try:
-        logger.info("Loading FAISS vector store...")
-        vector_store = FAISS.load_local(
-            folder_path="./faiss_index",
-            embeddings=embeddings,
-            allow_dangerous_deserialization=True
-        )
-        logger.info("Vector store loaded successfully")
-        return vector_store
+        folder_path = registry.resolve(chat_id)
+        if not folder_path:
+            logger.warning(f"No index registered for chat {chat_id}")
+            return None
+        return vector_cache.get(folder_path, _load_vector_store)
     except Exception as e:
         logger.error(f"Vector store loading failed: {str(e)}")
         return None
 
-def answer(question: str) -> str:
-    """Generates an answer to a question based on indexed article"""
+def get_documents(chat_id=None) -> List:
+    """All chunks of the chat's knowledge base in index order (sources in the order they were added)"""
+    vector_store = get_vector_store(chat_id)
+    if not vector_store:
+        return []
+    mapping = vector_store.index_to_docstore_id
+    return [vector_store.docstore.search(mapping[position]) for position in sorted(mapping)]
+
+def _load_keyword_index(folder_path: str):
+    index = BM25Index.load(folder_path)
+    if index is None:
+        # Knowledge bases saved before keyword indexing: build from the docstore once
+        vector_store = vector_cache.get(folder_path, _load_vector_store)
+        if vector_store is not None:
+            index = BM25Index.from_vector_store(vector_store)
+    return index
+
+def get_keyword_index(chat_id=None):
+    """Returns the chat's BM25 index, cached alongside its vector store"""
+    try:
+        folder_path = registry.resolve(chat_id)
+        if not folder_path:
+            return None
+        return vector_cache.get(folder_path, _load_keyword_index, kind="bm25", files=(BM25_FILE,))
+    except Exception as e:
+        logger.error(f"Keyword index loading failed: {str(e)}")
+        return None
+
+def _fuse(vector_store, vector_docs: list, keyword_hits: list) -> List:
+    """Reciprocal rank fusion of the vector and keyword rankings"""
+    docs = {}
+    vector_ranking = []
+    for doc in vector_docs:
+        key = doc.id or doc.page_content
+        docs[key] = doc
+        vector_ranking.append(key)
+    keyword_ranking = []
+    for doc_id, _ in keyword_hits:
+        if doc_id not in docs:
+            doc = vector_store.docstore.search(doc_id)
+            if not hasattr(doc, "page_content"):
+                continue  # docstore returns an error string for unknown ids
+            docs[doc_id] = doc
+        keyword_ranking.append(doc_id)
+    fused = reciprocal_rank_fusion([vector_ranking, keyword_ranking])
+    return [docs[key] for key in fused[:RETRIEVAL_K]]
+
+def prepare_answer(question: str, prompt: str = None, chat_id=None) -> dict:
+    """
+    Run everything before generation: checks, cache lookups and retrieval
+
+    Only the question is embedded and used as the search query; the prompt
+    (default or the user's custom one) just wraps the retrieved context.
+    Keyword (BM25) and vector search run at the same time and are merged
+    with reciprocal rank fusion.
+
+    Returns:
+        {"answer": text} when no LLM call is needed (cache hit or error),
+        otherwise {"prompt", "cache_group", "question", "vector"} for generation
+    """
     try:
         if not api_key:
-            return "❌ System error: OpenAI API key is missing"
+            return {"answer": "❌ System error: OpenAI API key is missing"}
         
         if not llm:
-            return "❌ System error: Language model not initialized"
+            return {"answer": "❌ System error: Language model not initialized"}
         
         logger.info(f"Processing question: '{question}'")
         
-        vector_store = get_vector_store()
+        folder_path = registry.resolve(chat_id)
+        version = index_version(folder_path) if folder_path else None
+        
+        vector_store = get_vector_store(chat_id)
         if not vector_store:
-            return "❌ System error: Knowledge base not available"
+            return {"answer": "❌ System error: Knowledge base not available"}
         
-        retrieved_docs = vector_store.similarity_search(question, k=4)
+        # Cached answers are only valid for the same prompt and model
+        cache_group = (
+            os.path.abspath(folder_path), version,
+            prompt_hash(f"gpt-4o-mini\n{PROMPT_TEMPLATE}\n{prompt or ''}")
+        )
+        cached = answer_cache.get_exact(cache_group, question)
+        if cached:
+            logger.info("Answer served from cache (exact match)")
+            return {"answer": cached}
+        
+        # The question is embedded once, for both the cache lookup and retrieval,
+        # while the keyword search runs here
+        vector_future = _query_pool.submit(embeddings.embed_query, question)
+        keyword_index = get_keyword_index(chat_id) if HYBRID_SEARCH else None
+        keyword_hits = keyword_index.search(question, HYBRID_CANDIDATES) if keyword_index else []
+        
+        question_vector = None
+        if keyword_hits and keyword_index.is_confident(question, keyword_hits):
+            try:
+                question_vector = vector_future.result(timeout=RETRIEVAL_BUDGET_MS / 1000)
+            except FutureTimeout:
+                logger.info("Confident keyword match, answering without waiting for vector search")
+            except Exception as e:
+                logger.warning(f"Question embedding failed, using keyword results: {str(e)}")
+        else:
+            question_vector = vector_future.result()
+        
+        vector_docs = []
+        if question_vector is not None:
+            cached = answer_cache.get_similar(cache_group, question_vector)
+            if cached:
+                return {"answer": cached}
+            # Cut to the knowledge base's dimensions the same way its chunk vectors were
+            vector_docs = vector_store.similarity_search_by_vector(
+                reduce_dimensions(question_vector, vector_store.index.d),
+                k=HYBRID_CANDIDATES if keyword_hits else RETRIEVAL_K
+            )
+        
+        if keyword_hits:
+            retrieved_docs = _fuse(vector_store, vector_docs, keyword_hits)
+        else:
+            retrieved_docs = vector_docs
         
         if not retrieved_docs:
             logger.warning("No relevant documents found")
-            return "❌ No relevant information found in knowledge base."
+            return {"answer": "❌ No relevant information found in knowledge base."}
         
         docs_content = "\n\n---\n\n".join([
             f"Document {i+1}:\n{doc.page_content}" 
             for i, doc in enumerate(retrieved_docs)
         ])
         
-        formatted_prompt = prompt_template.format(
-            question=question,
-            context=docs_content
-        )
+        formatted_prompt = build_prompt(prompt, question, docs_content)
         
+        return {
+            "prompt": formatted_prompt,
+            "cache_group": cache_group,
+            "question": question,
+            # Still pending when the keyword side short-circuited
+            "vector": question_vector if question_vector is not None else vector_future
+        }
+    
+    except Exception as e:
+        error_msg = f"Error processing question: {str(e)}"
+        logger.exception(error_msg)
+        return {"answer": f"❌ {error_msg}"}
+
+def _remember(prepared: dict, text: str):
+    vector = prepared["vector"]
+    if isinstance(vector, Future):
+        try:
+            vector = vector.result()
+        except Exception:
+            return
+    answer_cache.put(prepared["cache_group"], prepared["question"], vector, text)
+
+def answer(question: str, prompt: str = None, chat_id=None) -> str:
+    """Generates an answer to a question based on the chat's indexed article"""
+    prepared = prepare_answer(question, prompt, chat_id)
+    if "answer" in prepared:
+        return prepared["answer"]
+    
+    try:
         logger.info("Generating answer with LLM...")
-        response = llm.invoke(formatted_prompt)
+        response = llm.invoke(prepared["prompt"])
+        _remember(prepared, response.content)
         return response.content
     
     except Exception as e:
         error_msg = f"Error processing question: {str(e)}"
         logger.exception(error_msg)
         return f"❌ {error_msg}"
+
+def answer_stream(question: str, prompt: str = None, chat_id=None) -> Iterator[str]:
+    """Yields the answer in pieces as the model generates it"""
+    prepared = prepare_answer(question, prompt, chat_id)
+    if "answer" in prepared:
+        yield prepared["answer"]
+        return
+    
+    logger.info("Streaming answer from LLM...")
+    parts = []
+    for chunk in llm.stream(prepared["prompt"]):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+    _remember(prepared, "".join(parts))
+
+async def astream_prepared(prepared: dict) -> AsyncIterator[str]:
+    """Async streaming generation for the result of prepare_answer()"""
+    if "answer" in prepared:
+        yield prepared["answer"]
+        return
+    
+    logger.info("Streaming answer from LLM...")
+    parts = []
+    async for chunk in llm.astream(prepared["prompt"]):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+    _remember(prepared, "".join(parts))
+
+async def asummarize(docs: List, prompt: str, run_io=asyncio.to_thread) -> str:
+    """Map-reduce summary of docs; prompt's {text} receives the merged notes"""
+    if not summarizer:
+        return "❌ System error: Language model not initialized"
+    return await summarizer.asummarize(docs, prompt, run_io=run_io)
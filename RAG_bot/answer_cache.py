@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# Cosine similarity above which a question counts as a near-duplicate
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+class AnswerCache:
+    """
+    TTL/LRU cache of generated answers
+
+    Entries are grouped by (index path, index version, prompt hash). A lookup
+    first tries the normalized question text and then the most similar cached
+    question embedding of the same group.
+    """
+
+    def __init__(self, ttl: int = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries = OrderedDict()  # (group, question) -> (vector, answer, created)
+        self._groups = {}  # group -> set of entry keys
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _expired(self, created: float) -> bool:
+        return time.time() - created > self.ttl
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        members = self._groups.get(key[0])
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._groups[key[0]]
+
+    def get_exact(self, group: tuple, question: str) -> Optional[str]:
+        key = (group, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[2]):
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry[1]
+
+    def get_similar(self, group: tuple, vector: List[float]) -> Optional[str]:
+        query = np.asarray(vector, dtype=np.float32)
+        query /= (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for key in list(self._groups.get(group, ())):
+                cached_vector, _, created = self._entries[key]
+                if self._expired(created):
+                    self._drop(key)
+                    continue
+                score = float(np.dot(query, cached_vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.stats["semantic_hits"] += 1
+            logger.info(f"Answer cache semantic hit (similarity {best_score:.3f})")
+            return self._entries[best_key][1]
+
+    def put(self, group: tuple, question: str, vector: List[float], answer: str):
+        cached_vector = np.asarray(vector, dtype=np.float32)
+        cached_vector /= (np.linalg.norm(cached_vector) or 1.0)
+        key = (group, normalize_question(question))
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (cached_vector, answer, time.time())
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, index_path: str):
+        """Drop every answer generated from the given index"""
+        index_path = os.path.abspath(index_path)
+        with self._lock:
+            for group in [g for g in self._groups if g[0] == index_path]:
+                for key in list(self._groups.get(group, ())):
+                    self._drop(key)
+
+
+answer_cache = AnswerCache()
+
+
+def invalidate_answers(index_path: str):
+    """Invalidation hook for the index registry after a knowledge base changes"""
+    answer_cache.invalidate(index_path)
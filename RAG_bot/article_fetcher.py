@@ -0,0 +1,257 @@
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+import aiohttp
+
+from sqlite_cache import SqliteLRUCache
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "50"))
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "4"))
+FETCH_USER_AGENT = os.getenv("FETCH_USER_AGENT", "Mozilla/5.0 (compatible; ArticleAssistantBot/1.0)")
+# Responses without a Cache-Control max-age are reused without revalidation for this long
+FETCH_CACHE_MIN_TTL = int(os.getenv("FETCH_CACHE_MIN_TTL", "300"))
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH", "./http_cache.db")
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "200"))
+MAX_ARTICLE_BYTES = 10 * 1024 * 1024
+
+try:
+    import brotli  # noqa: F401 - aiohttp decodes "br" when it is installed
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+
+def _max_age(cache_control: str) -> int:
+    match = _MAX_AGE.search(cache_control or "")
+    return int(match.group(1)) if match else FETCH_CACHE_MIN_TTL
+
+
+class HttpCache(SqliteLRUCache):
+    """Responses on disk with their validators, evicted least-recently-used past a size limit"""
+
+    TABLE = "responses"
+    KEY = "url"
+    _COLUMNS = ("url", "final_url", "etag", "last_modified", "content_type", "encoding",
+                "body", "extracted", "extractor", "fetched_at", "max_age")
+
+    def __init__(self, path: str = HTTP_CACHE_PATH, max_bytes: int = HTTP_CACHE_MAX_MB * 1024 * 1024):
+        super().__init__(path, max_bytes, '''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                final_url TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                encoding TEXT,
+                body BLOB NOT NULL,
+                extracted TEXT,
+                extractor TEXT,
+                fetched_at REAL NOT NULL,
+                max_age INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        try:
+            # Caches created before extracted text was versioned
+            self._conn.execute("ALTER TABLE responses ADD COLUMN extractor TEXT")
+        except sqlite3.OperationalError:
+            pass
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(url)
+        return dict(zip(self._COLUMNS, row))
+
+    def put(self, entry: dict):
+        size = len(entry["body"]) + len(entry.get("extracted") or "")
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO responses ({', '.join(self._COLUMNS)}, size, last_access) "
+                f"VALUES ({', '.join('?' * (len(self._COLUMNS) + 2))})",
+                tuple(entry.get(c) for c in self._COLUMNS) + (size, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, url: str, max_age: int):
+        """Mark a revalidated (304) response fresh again"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ?, max_age = ?, last_access = ? WHERE url = ?",
+                (now, max_age, now, url)
+            )
+            self._conn.commit()
+
+    def set_extracted(self, url: str, text: str, extractor: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET extracted = ?, extractor = ?, size = LENGTH(body) + ? WHERE url = ?",
+                (text, extractor, len(text), url)
+            )
+            self._conn.commit()
+
+
+class ArticleFetcher:
+    """
+    Shared HTTP client for article URLs
+
+    One aiohttp session with a pooled connector lives on a private event
+    loop thread, so both worker threads and coroutines reuse its connections.
+    Responses are cached on disk and revalidated with ETag/Last-Modified.
+    """
+
+    def __init__(self, cache: Optional[HttpCache] = None):
+        self._cache = cache
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+        self.stats = {"fresh": 0, "revalidated": 0, "downloaded": 0}
+
+    @property
+    def cache(self) -> HttpCache:
+        if self._cache is None:
+            self._cache = HttpCache()
+        return self._cache
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="article-fetcher")
+                self._thread.start()
+            return self._loop
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Created on the fetcher loop, which is the only loop that uses it
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=FETCH_MAX_CONNECTIONS,
+                    limit_per_host=FETCH_PER_HOST,
+                    ttl_dns_cache=300
+                ),
+                timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT, connect=10),
+                headers={"User-Agent": FETCH_USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING}
+            )
+        return self._session
+
+    async def _fetch(self, url: str) -> dict:
+        cached = self.cache.get(url)
+        if cached and time.time() - cached["fetched_at"] < cached["max_age"]:
+            self.stats["fresh"] += 1
+            logger.info(f"HTTP cache hit for {url}")
+            return {**cached, "cache": "fresh"}
+
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        session = await self._get_session()
+        async with session.get(url, headers=headers, allow_redirects=True) as response:
+            cache_control = response.headers.get("Cache-Control", "")
+            if response.status == 304 and cached:
+                self.cache.touch(url, _max_age(cache_control))
+                self.stats["revalidated"] += 1
+                logger.info(f"Not modified since last fetch: {url}")
+                return {**cached, "cache": "revalidated"}
+            if response.status >= 400:
+                raise RuntimeError(f"HTTP {response.status} for {url}")
+            if (response.content_length or 0) > MAX_ARTICLE_BYTES:
+                raise ValueError(f"Page too large ({response.content_length / 1024 / 1024:.1f}MB)")
+
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                body.extend(chunk)
+                if len(body) > MAX_ARTICLE_BYTES:
+                    raise ValueError("Page too large (over 10MB)")
+
+            entry = {
+                "url": url,
+                "final_url": str(response.url),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_type": response.headers.get("Content-Type"),
+                "encoding": response.charset,
+                "body": bytes(body),
+                "extracted": None,
+                "extractor": None,
+                "fetched_at": time.time(),
+                "max_age": _max_age(cache_control)
+            }
+
+        if "no-store" not in cache_control:
+            self.cache.put(entry)
+        self.stats["downloaded"] += 1
+        logger.info(f"Downloaded {len(entry['body']) / 1024:.0f}KB from {url}")
+        return {**entry, "cache": None}
+
+    async def afetch(self, url: str) -> dict:
+        """Fetch from any event loop; the request itself runs on the fetcher loop"""
+        future = asyncio.run_coroutine_threadsafe(self._fetch(url), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    def fetch(self, url: str) -> dict:
+        """
+        Fetch a page for worker threads
+
+        Returns:
+            Dict with body, encoding, content_type, final_url, extracted and
+            extractor (text stored by set_extracted for an unchanged page,
+            else None) and cache ("fresh", "revalidated" or None)
+        """
+        return asyncio.run_coroutine_threadsafe(self._fetch(url), self._ensure_loop()).result()
+
+    def set_extracted(self, url: str, text: str, extractor: str):
+        """Remember the text extracted from the cached body so unchanged pages are not parsed again"""
+        self.cache.set_extracted(url, text, extractor)
+
+    def shutdown(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+                self._session = None
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+
+
+article_fetcher = ArticleFetcher()
+
+
+def decode_body(page: dict) -> str:
+    """Page text, using the header charset, then a <meta> charset, then UTF-8"""
+    encoding = page.get("encoding")
+    if not encoding:
+        match = _META_CHARSET.search(page["body"][:4096])
+        encoding = match.group(1).decode() if match else "utf-8"
+    try:
+        return page["body"].decode(encoding, errors="replace")
+    except LookupError:
+        return page["body"].decode("utf-8", errors="replace")
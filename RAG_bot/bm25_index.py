@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import math
+import heapq
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Top keyword hit counts as confident when it scores this many times the runner-up
+BM25_CONFIDENCE_RATIO = float(os.getenv("BM25_CONFIDENCE_RATIO", "2.0"))
+RRF_K = 60
+
+# Identifiers like "ERR-42", "v1.2.3" or "10:30" stay whole, their parts are indexed too
+_COMPOUND = re.compile(r"\w+(?:[.\-:/]\w+)+|\w+")
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _COMPOUND.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(_WORD.findall(token))
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index over the chunks of one knowledge base, stored next to its FAISS files
+
+    Chunks are added and removed in place: only their own texts are
+    tokenized. Removed chunks leave a gap in the doc numbers until gaps make
+    up half of them, then the postings are renumbered.
+    """
+
+    def __init__(self, ids: List[Optional[str]], lengths: List[int], postings: Dict[str, List[List[int]]]):
+        self.ids = ids            # doc number -> docstore id, None for removed chunks
+        self.lengths = lengths
+        self.postings = postings  # term -> [[doc number, term frequency], ...]
+        self._numbers = {doc_id: number for number, doc_id in enumerate(ids) if doc_id is not None}
+        self.total_length = sum(lengths)
+
+    @property
+    def avg_length(self) -> float:
+        return (self.total_length / len(self._numbers)) if self._numbers else 0.0
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]]) -> "BM25Index":
+        """Index (docstore id, text) pairs"""
+        index = cls([], [], {})
+        index.add(documents)
+        return index
+
+    @classmethod
+    def from_vector_store(cls, vector_store) -> "BM25Index":
+        """Index every chunk of a FAISS store, in index order"""
+        mapping = vector_store.index_to_docstore_id
+        return cls.build(
+            (mapping[position], vector_store.docstore.search(mapping[position]).page_content)
+            for position in sorted(mapping)
+        )
+
+    def add(self, documents: Iterable[Tuple[str, str]]):
+        """Index new (docstore id, text) pairs"""
+        for doc_id, text in documents:
+            if doc_id in self._numbers:
+                raise ValueError(f"Chunk {doc_id} is already indexed")
+            terms = Counter(tokenize(text))
+            number = len(self.ids)
+            self.ids.append(doc_id)
+            self.lengths.append(sum(terms.values()))
+            self.total_length += self.lengths[number]
+            self._numbers[doc_id] = number
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append([number, frequency])
+
+    def remove(self, documents: Iterable[Tuple[str, str]]):
+        """Drop (docstore id, text) pairs; the text tells which postings hold the chunk"""
+        removed = {}
+        for doc_id, text in documents:
+            number = self._numbers.pop(doc_id, None)
+            if number is None:
+                continue
+            self.ids[number] = None
+            self.total_length -= self.lengths[number]
+            self.lengths[number] = 0
+            for term in set(tokenize(text)):
+                removed.setdefault(term, set()).add(number)
+        for term, numbers in removed.items():
+            postings = [posting for posting in self.postings.get(term, ()) if posting[0] not in numbers]
+            if postings:
+                self.postings[term] = postings
+            else:
+                self.postings.pop(term, None)
+        if len(self._numbers) * 2 < len(self.ids):
+            self._compact()
+
+    def _compact(self):
+        renumber = {}
+        for number, doc_id in enumerate(self.ids):
+            if doc_id is not None:
+                renumber[number] = len(renumber)
+        self.ids = [doc_id for doc_id in self.ids if doc_id is not None]
+        self.lengths = [self.lengths[number] for number in renumber]
+        self._numbers = {doc_id: number for number, doc_id in enumerate(self.ids)}
+        for postings in self.postings.values():
+            for posting in postings:
+                posting[0] = renumber[posting[0]]
+
+    def save(self, folder_path: str):
+        with open(os.path.join(folder_path, BM25_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "lengths": self.lengths, "postings": self.postings},
+                      f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, folder_path: str) -> Optional["BM25Index"]:
+        path = os.path.join(folder_path, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["lengths"], data["postings"])
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Best matching chunks for the query as (docstore id, score), best first"""
+        total = len(self._numbers)
+        if not total:
+            return []
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, frequency in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[number] / self.avg_length)
+                scores[number] = scores.get(number, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.ids[number], score) for number, score in best]
+
+    def _contains(self, doc_id: str, term: str) -> bool:
+        number = self._numbers.get(doc_id)
+        return any(posting[0] == number for posting in self.postings.get(term, ()))
+
+    def is_confident(self, query: str, hits: List[Tuple[str, float]],
+                     ratio: float = BM25_CONFIDENCE_RATIO) -> bool:
+        """
+        Whether the keyword ranking alone is good enough to answer from
+
+        Only questions with exact terms (codes, numbers, identifiers, names)
+        qualify: the top hit has to contain all of them and clearly outscore
+        the runner-up.
+        """
+        terms = exact_terms(query)
+        if not hits or not terms:
+            return False
+        top_id, top_score = hits[0]
+        if not all(self._contains(top_id, term) for term in terms):
+            return False
+        return len(hits) == 1 or top_score >= ratio * hits[1][1]
+
+
+def exact_terms(query: str) -> List[str]:
+    """Query terms a keyword match is reliable for: anything with digits or separators, acronyms, names"""
+    terms = []
+    for match in _COMPOUND.finditer(query):
+        token = match.group()
+        if (any(c.isdigit() for c in token) or not token.isalnum()
+                or (len(token) > 1 and token.isupper())
+                or (match.start() > 0 and token[0].isupper())):
+            terms.append(token.lower())
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """Merge rankings of keys: each key scores sum(1 / (k + rank)) over the rankings it appears in"""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -1,18 +1,17 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
 from bot_utils import (
     get_main_menu_keyboard, get_prompt_menu_keyboard, 
-    get_lang_menu_keyboard, get_cancel_keyboard
+    get_lang_menu_keyboard, get_cancel_keyboard, StreamingMessage
 )
 from bot_config import (
     LANGUAGES, DEFAULT_PROMPT, MAIN_MENU, ENTER_CUSTOM_PROMPT,
     ENTER_LINK, ASK_QUESTION, CHANGE_LANG, PROMPT_MENU, ENTER_YOUTUBE_URL, logger
 )
-from Requests import answer
-from indexer import reindex, reindex_video_transcript
-from youtube_processor import YouTubeProcessor
+from executor import (
+    aanswer_stream, areindex, areindex_video_transcript,
+    aget_vector_store, aprocess_youtube_video, asummarize_documents
+)
 import os
 
 # Handlers
@@ -124,18 +123,18 @@ async def handle_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return MAIN_MENU
     
-    await update.message.reply_text(LANGUAGES[lang]['processing'])
+    placeholder = await update.message.reply_text(LANGUAGES[lang]['processing'])
     
     try:
         current_prompt = context.user_data.get('current_prompt', DEFAULT_PROMPT[lang])
-        full_query = f"{current_prompt}\n\nQuestion: {text}"
-        
-        response = answer(full_query)
         
-        await update.message.reply_text(
-            response,
-            parse_mode="Markdown"
-        )
+        # Edit the placeholder as the answer is generated
+        stream = StreamingMessage(placeholder)
+        response = ""
+        async for piece in aanswer_stream(text, prompt=current_prompt, chat_id=update.effective_chat.id):
+            response += piece
+            await stream.update(response)
+        await stream.finish(response)
         
         await update.message.reply_text(
             LANGUAGES[lang]['after_answer'],
@@ -233,7 +232,11 @@ async def handle_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_cancel_keyboard(lang)
         )
         
-        num_chunks = reindex(source)
+        num_chunks = await areindex(
+            source,
+            chat_id=update.effective_chat.id,
+            source_name=source if source_type == 'url' else file_name
+        )
         
         context.user_data['has_article'] = True
         context.user_data['last_source_type'] = source_type
@@ -284,29 +287,18 @@ async def handle_summarize(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(LANGUAGES[lang]['summarizing'])
     
     try:
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url="https://api.proxyapi.ru/openai/v1"
-        )
-        
-        vector_store = FAISS.load_local(
-            folder_path="./faiss_index",
-            embeddings=embeddings,
-            allow_dangerous_deserialization=True
-        )
-
-        docs = vector_store.similarity_search("Summarize key points", k=4)
-        
-        if not docs:
+        vector_store = await aget_vector_store(update.effective_chat.id)
+        if not vector_store:
             await update.message.reply_text(LANGUAGES[lang]['no_content'])
             return MAIN_MENU
-        
-        summary_prompt = DEFAULT_PROMPT['summary_prompt'][lang].format(
-            text="\n\n".join([doc.page_content[:500] for doc in docs])
+
+        # Every chunk is summarized, the language only changes the final step
+        response = await asummarize_documents(
+            DEFAULT_PROMPT['summary_prompt'][lang], chat_id=update.effective_chat.id
         )
-        
-        response = answer(summary_prompt)
+        if not response:
+            await update.message.reply_text(LANGUAGES[lang]['no_content'])
+            return MAIN_MENU
         
         await update.message.reply_text(
             f"{LANGUAGES[lang]['summary_title']}\n\n{response}",
@@ -425,16 +417,15 @@ async def handle_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return ENTER_YOUTUBE_URL
         
-        # Initialize YouTube processor
-        processor = YouTubeProcessor()
-        
         # Download video
         await update.message.reply_text(
             get_text('downloading_video', 'Downloading video...'),
             reply_markup=get_cancel_keyboard(lang)
         )
         
-        video_title, transcript, video_info = processor.process_youtube_video(text)
+        # Download runs in the thread pool, transcription in the Whisper workers;
+        # repeat videos come from the transcript cache inside the pipeline
+        video_title, transcript, video_info = await aprocess_youtube_video(text)
         
         if not video_title or not transcript:
             # Provide more detailed error information
@@ -452,7 +443,6 @@ async def handle_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 f"❌ {error_msg}",
                 reply_markup=get_main_menu_keyboard(lang, has_article)
             )
-            processor.cleanup()
             return MAIN_MENU
         
         # Transcribe video
@@ -467,7 +457,9 @@ async def handle_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
             reply_markup=get_cancel_keyboard(lang)
         )
         
-        num_chunks = reindex_video_transcript(video_title, transcript, video_info)
+        num_chunks = await areindex_video_transcript(
+            video_title, transcript, video_info, chat_id=update.effective_chat.id
+        )
         
         # Update user data
         context.user_data['has_article'] = True
@@ -491,9 +483,6 @@ async def handle_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
             parse_mode="Markdown"
         )
         
-        # Cleanup
-        processor.cleanup()
-        
     except Exception as e:
         logger.error(f"YouTube processing error: {str(e)}")
         error_msg = get_text('youtube_processing_error', 'Error processing YouTube video: {}').format(str(e))
@@ -50,8 +50,23 @@ def main():
     
     application.add_handler(conv_handler)
     
+    from executor import executor
+    from transcription_service import transcription_service
+    from pdf_extractor import pdf_extractor
+    from article_fetcher import article_fetcher
+    
+    # Load Whisper in the background so the first video doesn't pay for it
+    if os.getenv("WHISPER_PRELOAD", "true").lower() == "true":
+        transcription_service.start(background=True)
+    
     logger.info("Starting bot...")
-    application.run_polling()
+    try:
+        application.run_polling()
+    finally:
+        executor.shutdown()
+        transcription_service.shutdown()
+        pdf_extractor.shutdown()
+        article_fetcher.shutdown()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
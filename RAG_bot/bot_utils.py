@@ -1,9 +1,16 @@
 from telegram import ReplyKeyboardMarkup, KeyboardButton
+from telegram.error import BadRequest, RetryAfter
 from bot_config import LANGUAGES, logger
 import os
 import glob
+import time
+import asyncio
 from datetime import datetime, timedelta
 
+# Telegram allows roughly one edit per second per chat
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
 def get_main_menu_keyboard(lang: str, has_article: bool = False):
     buttons = []
     if has_article:
@@ -46,4 +53,104 @@ def cleanup_temp_files(max_age_hours=1):
                 os.remove(file_path)
                 logger.info(f"Removed temp file: {file_path}")
     except Exception as e:
-        logger.error(f"Cleanup error: {str(e)}")
\ No newline at end of file
+        logger.error(f"Cleanup error: {str(e)}")
+
+def markdown_safe_cut(text: str, limit: int) -> int:
+    """Position <= limit at a line or word boundary that doesn't leave a code block open"""
+    if len(text) <= limit:
+        cut = len(text)
+    else:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+    # Stop before an unterminated ``` block
+    if text.count("```", 0, cut) % 2:
+        cut = text.rfind("```", 0, cut)
+    return cut
+
+class StreamingMessage:
+    """Shows a growing answer by editing one Telegram message in throttled steps"""
+    
+    def __init__(self, message, interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.offset = 0        # start of the current message's text in the answer
+        self.prefix = ""       # reopens a code block split across messages
+        self.shown = ""
+        self.next_edit = 0.0
+    
+    async def _edit(self, text: str, parse_mode=None, wait: bool = False) -> bool:
+        if not text.strip() or (text == self.shown and parse_mode is None):
+            return True
+        try:
+            await self.message.edit_text(text, parse_mode=parse_mode)
+            self.shown = text
+            return True
+        except RetryAfter as e:
+            delay = e.retry_after
+            delay = delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+            self.next_edit = time.monotonic() + delay
+            if wait:
+                # Final edits must land, intermediate ones can be skipped
+                await asyncio.sleep(delay)
+                return await self._edit(text, parse_mode)
+            return False
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return True
+            if parse_mode:
+                # Unbalanced Markdown from the model, show it as plain text
+                return await self._edit(text, wait=wait)
+            logger.error(f"Streaming edit failed: {str(e)}")
+            return False
+    
+    def _body(self, text: str) -> str:
+        return self.prefix + text[self.offset:]
+    
+    async def _roll_over(self, text: str):
+        """Finish the current message and continue the answer in a new one"""
+        body = self._body(text)
+        limit = TELEGRAM_MESSAGE_LIMIT - 100
+        cut = markdown_safe_cut(body, limit)
+        prefix = ""
+        consumed = cut
+        if cut <= len(self.prefix):
+            # A code block longer than a whole message: close it here and reopen it in the next one
+            cut = body.rfind("\n", len(self.prefix) + 1, limit - 4)
+            if cut <= len(self.prefix):
+                cut = limit - 4
+            fence_end = body.find("\n")
+            prefix = (body[:fence_end] if 0 < fence_end < cut else "```") + "\n"
+            part = body[:cut] + "\n```"
+            # The line break at the cut is replaced by the reopened fence
+            consumed = cut + 1 if body[cut:cut + 1] == "\n" else cut
+        else:
+            part = body[:cut]
+        await self._edit(part, parse_mode="Markdown", wait=True)
+        self.offset += consumed - len(self.prefix)
+        self.prefix = prefix
+        self.shown = ""
+        self.message = await self.message.reply_text("…")
+    
+    async def update(self, text: str):
+        """Called with the whole answer so far; edits at most once per interval"""
+        while len(self._body(text)) > TELEGRAM_MESSAGE_LIMIT - 100:
+            await self._roll_over(text)
+        now = time.monotonic()
+        if now < self.next_edit:
+            return
+        current = self._body(text)
+        # Inside a reopened code block nothing is safe to cut at, show it all as plain text
+        cut = markdown_safe_cut(current, len(current))
+        if cut <= len(self.prefix):
+            cut = len(current)
+        if await self._edit(current[:cut]):
+            self.next_edit = now + self.interval
+    
+    async def finish(self, text: str):
+        """Final edit with Markdown formatting"""
+        while len(self._body(text)) > TELEGRAM_MESSAGE_LIMIT - 100:
+            await self._roll_over(text)
+        await self._edit(self._body(text), parse_mode="Markdown", wait=True)
@@ -0,0 +1,140 @@
+import re
+import html
+import logging
+import xml.etree.ElementTree as ET
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Preferred subtitle formats, in order
+CAPTION_FORMATS = ("vtt", "srv3", "srv2", "srv1")
+# Captions shorter than this are treated as missing
+MIN_CAPTION_CHARS = 50
+# One timestamped paragraph per this many seconds of speech
+PARAGRAPH_SECONDS = 30.0
+
+_TIMING = re.compile(r"(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})")
+_TAG = re.compile(r"<[^>]+>")
+
+Segment = Tuple[float, float, str]
+
+
+def _seconds(hours, minutes, seconds, millis) -> float:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def _clean(text: str) -> str:
+    return re.sub(r"\s+", " ", html.unescape(_TAG.sub("", text))).strip()
+
+
+def parse_vtt(content: str) -> List[Segment]:
+    """
+    Parse WebVTT into (start, end, text) segments
+
+    Auto-generated captions repeat the previous line at the top of every cue
+    ("rolling" captions), so lines already emitted are skipped.
+    """
+    segments = []
+    last_line = None
+    start = end = None
+    for raw_line in content.splitlines():
+        line = raw_line.strip()
+        timing = _TIMING.search(line)
+        if timing:
+            g = timing.groups()
+            start, end = _seconds(*g[:4]), _seconds(*g[4:])
+            continue
+        if start is None or not line or line.startswith(("NOTE", "STYLE", "REGION")):
+            continue
+        text = _clean(line)
+        if not text or text == last_line:
+            continue
+        segments.append((start, end, text))
+        last_line = text
+    return segments
+
+
+def parse_srv(content: str) -> List[Segment]:
+    """Parse YouTube timedtext XML (srv1 <text start dur>, srv2/srv3 <p t d> in ms)"""
+    root = ET.fromstring(content)
+    segments = []
+    for element in root.iter():
+        if element.tag == "text" and "start" in element.attrib:
+            start = float(element.attrib["start"])
+            end = start + float(element.attrib.get("dur", 0))
+        elif element.tag == "p" and "t" in element.attrib:
+            start = int(element.attrib["t"]) / 1000
+            end = start + int(element.attrib.get("d", 0)) / 1000
+        else:
+            continue
+        text = _clean("".join(element.itertext()))
+        if text:
+            segments.append((start, end, text))
+    return segments
+
+
+def _timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def segments_to_text(segments: List[Segment], paragraph_seconds: float = PARAGRAPH_SECONDS) -> str:
+    """Join segments into paragraphs, each prefixed with the [hh:mm:ss] of its first segment"""
+    paragraphs = []
+    current, current_start = [], None
+    for start, _, text in segments:
+        if current and start - current_start >= paragraph_seconds:
+            paragraphs.append(f"[{_timestamp(current_start)}] {' '.join(current)}")
+            current = []
+        if not current:
+            current_start = start
+        current.append(text)
+    if current:
+        paragraphs.append(f"[{_timestamp(current_start)}] {' '.join(current)}")
+    return "\n\n".join(paragraphs)
+
+
+def choose_track(info: dict, language: Optional[str] = None) -> Optional[Tuple[str, dict, bool]]:
+    """
+    Pick the best caption track from yt-dlp video info
+
+    Uploaded subtitles in the requested or the video's language come first,
+    then auto-generated captions in the spoken language (never YouTube's
+    machine-translated auto captions).
+
+    Returns:
+        Tuple of (language code, track format dict, is_automatic) or None
+    """
+    video_language = info.get("language")
+    manual = info.get("subtitles") or {}
+    automatic = info.get("automatic_captions") or {}
+
+    def pick(tracks: dict, codes) -> Optional[Tuple[str, dict]]:
+        for code in codes:
+            if not code or code not in tracks:
+                continue
+            by_ext = {t.get("ext"): t for t in tracks[code] if t.get("url")}
+            for ext in CAPTION_FORMATS:
+                if ext in by_ext:
+                    return code, by_ext[ext]
+        return None
+
+    manual_codes = [language, video_language]
+    if not video_language and len(manual) == 1:
+        manual_codes.append(next(iter(manual)))
+    found = pick(manual, manual_codes)
+    if found:
+        return found[0], found[1], False
+
+    orig_codes = [f"{video_language}-orig", video_language] if video_language else []
+    orig_codes += [code for code in automatic if code.endswith("-orig")]
+    found = pick(automatic, orig_codes)
+    if found:
+        return found[0].replace("-orig", ""), found[1], True
+    return None
+
+
+def parse_captions(content: str, ext: str) -> List[Segment]:
+    if ext == "vtt":
+        return parse_vtt(content)
+    return parse_srv(content)
@@ -0,0 +1,141 @@
+import os
+import re
+import zlib
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Jaccard similarity of word shingles above which a chunk counts as a duplicate.
+# Transcripts repeat phrases a lot, so they are deduplicated more eagerly.
+DEFAULT_THRESHOLDS = {"url": 0.8, "file": 0.9, "youtube": 0.75}
+DEFAULT_THRESHOLD = 0.85
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD = re.compile(r"\w+")
+
+# Fixed seed: signatures of the same text are identical across runs
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def _parse_thresholds(value: str) -> Dict[str, float]:
+    """DEDUP_THRESHOLDS=url:0.8,file:0.9,youtube:0.75"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        source_type, _, threshold = item.partition(":")
+        try:
+            thresholds[source_type.strip()] = float(threshold)
+        except ValueError:
+            logger.warning(f"Ignoring invalid dedup threshold '{item}'")
+    return thresholds
+
+
+DEDUP_THRESHOLDS = _parse_thresholds(os.getenv("DEDUP_THRESHOLDS", ""))
+
+
+def threshold_for(source_type: str) -> float:
+    return DEDUP_THRESHOLDS.get(source_type, DEFAULT_THRESHOLD)
+
+
+def _shingles(text: str) -> np.ndarray:
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in set(grams)), dtype=np.uint64)
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of the text's word shingles (NUM_PERM values)"""
+    hashes = _shingles(text)
+    if hashes.size == 0:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    # Universal hashing (a*x + b) mod p; 32-bit inputs and factors cannot overflow uint64
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0)
+
+
+def _lsh_params(threshold: float, num_perm: int = NUM_PERM, recall: float = 0.95) -> Tuple[int, int]:
+    """
+    Bands and rows per band for the LSH index
+
+    The most selective split (most rows per band) that still makes a pair
+    exactly at the threshold a candidate with the given probability;
+    candidates are verified against the threshold afterwards.
+    """
+    for rows in range(num_perm, 0, -1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class ChunkDeduplicator:
+    """
+    Drops chunks whose text nearly repeats an earlier chunk of the same source
+
+    Signatures go into an LSH index of banded buckets; only chunks sharing a
+    bucket are compared, so a source is deduplicated in roughly linear time.
+    The first occurrence is kept. State persists across calls, so batches of
+    one streamed source are deduplicated against each other.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.bands, self.rows = _lsh_params(threshold)
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._signatures = []
+        self.seen = 0
+        self.removed = 0
+
+    def _is_duplicate(self, signature: np.ndarray) -> bool:
+        candidates = set()
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            candidates.update(buckets.get(key, ()))
+        return any(
+            np.mean(self._signatures[c] == signature) >= self.threshold
+            for c in candidates
+        )
+
+    def _add(self, signature: np.ndarray):
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            buckets.setdefault(key, []).append(index)
+
+    def filter(self, splits: list) -> list:
+        kept = []
+        for split in splits:
+            self.seen += 1
+            signature = minhash(split.page_content)
+            if self._is_duplicate(signature):
+                self.removed += 1
+                continue
+            self._add(signature)
+            kept.append(split)
+        return kept
+
+
+def dedup_chunks(splits: list, source_type: str) -> list:
+    """Remove near-duplicate chunks using the source type's threshold"""
+    if not DEDUP_ENABLED or len(splits) < 2:
+        return splits
+    deduplicator = ChunkDeduplicator(threshold_for(source_type))
+    kept = deduplicator.filter(splits)
+    if deduplicator.removed:
+        logger.info(f"🧹 Removed {deduplicator.removed} of {len(splits)} chunks as near-duplicates "
+                    f"(threshold {deduplicator.threshold})")
+    return kept
@@ -0,0 +1,170 @@
+import re
+import logging
+from typing import Optional, Tuple
+
+import lxml.html
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction changes so cached extracted text is not reused
+EXTRACTOR_VERSION = "lxml-density-1"
+
+# Removed before scoring, never part of an article
+_DROP_TAGS = ("script", "style", "noscript", "iframe", "svg", "canvas", "form", "button",
+              "select", "input", "template", "object", "embed", "nav", "footer", "aside")
+# Elements whose text is scored and emitted as paragraphs
+_LEAF_TAGS = ("p", "pre", "h1", "h2", "h3", "h4", "h5", "h6")
+# ...and these, as long as they have no block elements inside
+_MIXED_TAGS = ("div", "li", "td", "dd", "blockquote")
+# Containers that can hold the article
+_CANDIDATE_TAGS = {"div", "article", "section", "main", "td", "body", "blockquote"}
+
+_POSITIVE = re.compile(r"article|body|content|entry|main|page|post|text|blog|story", re.I)
+_NEGATIVE = re.compile(r"comment|footer|footnote|sidebar|widget|menu|\bnav|breadcrumb|share|social|related|"
+                       r"recommend|promo|sponsor|\bads?\b|\bad-|banner|cookie|subscribe|popup|masthead", re.I)
+_WHITESPACE = re.compile(r"\s+")
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+_BLOCK_TAGS = ("p", "div", "section", "article", "ul", "ol", "table", "pre", "blockquote",
+               "h1", "h2", "h3", "h4", "h5", "h6", "dl")
+
+MIN_PARAGRAPH_CHARS = 25
+# Below this the best candidate is probably wrong, the whole body is used instead
+MIN_ARTICLE_CHARS = 250
+
+
+def _text(element) -> str:
+    return _WHITESPACE.sub(" ", element.text_content()).strip()
+
+
+def _is_text_block(element) -> bool:
+    if element.tag in _LEAF_TAGS:
+        return True
+    if element.tag in _MIXED_TAGS:
+        return next(element.iterdescendants(*_BLOCK_TAGS), None) is None
+    return False
+
+
+def _text_blocks(element):
+    """Paragraph-like elements under element (including element itself); they never nest"""
+    return (e for e in element.iter(*_LEAF_TAGS, *_MIXED_TAGS) if _is_text_block(e))
+
+
+def _class_weight(element) -> int:
+    weight = 0
+    for attribute in ("class", "id"):
+        value = element.get(attribute)
+        if not value:
+            continue
+        if _NEGATIVE.search(value):
+            weight -= 25
+        if _POSITIVE.search(value):
+            weight += 25
+    return weight
+
+
+def _link_density(element, text_length: int) -> float:
+    if not text_length:
+        return 1.0
+    link_length = sum(len(_text(a)) for a in element.iter("a"))
+    return min(1.0, link_length / text_length)
+
+
+def _drop_boilerplate(root):
+    for element in list(root.iter(*_DROP_TAGS)):
+        element.drop_tree()
+    # Hidden blocks and elements whose class/id marks them as page chrome
+    for element in list(root.iter("div", "section", "ul", "header")):
+        if element.getparent() is None:
+            continue
+        style = (element.get("style") or "").replace(" ", "")
+        if "display:none" in style or element.get("hidden") is not None or \
+                (_class_weight(element) < 0 and element.tag != "body"):
+            element.drop_tree()
+
+
+def _score_candidates(root) -> dict:
+    """Readability-style scores: every paragraph credits its parent fully and its grandparent by half"""
+    scores = {}
+    for element in _text_blocks(root):
+        text = _text(element)
+        if len(text) < MIN_PARAGRAPH_CHARS:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = element.getparent()
+        for ancestor, share in ((parent, 1.0), (parent.getparent() if parent is not None else None, 0.5)):
+            if ancestor is None or ancestor.tag not in _CANDIDATE_TAGS:
+                continue
+            if ancestor not in scores:
+                scores[ancestor] = _class_weight(ancestor) + (5 if ancestor.tag in ("article", "main") else 0)
+            scores[ancestor] += score * share
+    # Containers full of links (menus, tag clouds) lose most of their score
+    for element in scores:
+        scores[element] *= 1 - _link_density(element, len(_text(element)))
+    return scores
+
+
+def _paragraphs(element) -> list:
+    """Text of the paragraph-like elements under element, one line each"""
+    paragraphs = []
+    for block in _text_blocks(element):
+        text = _text(block)
+        if text:
+            paragraphs.append(text)
+    if not paragraphs:
+        text = _text(element)
+        if text:
+            paragraphs.append(text)
+    return paragraphs
+
+
+def _title(root) -> Optional[str]:
+    for xpath in ('//meta[@property="og:title"]/@content', "//title/text()", "//h1"):
+        found = root.xpath(xpath)
+        if found:
+            value = found[0] if isinstance(found[0], str) else found[0].text_content()
+            value = _WHITESPACE.sub(" ", value).strip()
+            if value:
+                return value
+    return None
+
+
+def extract_article(html: str) -> Tuple[Optional[str], str]:
+    """
+    Title and main text of an HTML page from a single lxml parse
+
+    The container with the densest paragraph text wins; its siblings are
+    added when they score close to it (articles split over several blocks).
+
+    Returns:
+        Tuple of (title, text); paragraphs are separated by newlines
+    """
+    try:
+        root = lxml.html.document_fromstring(_XML_DECLARATION.sub("", html))
+    except (etree.ParserError, ValueError):
+        return None, ""
+
+    title = _title(root)
+    _drop_boilerplate(root)
+    body = root.find("body")
+    if body is None:
+        body = root
+
+    scores = _score_candidates(body)
+    if scores:
+        best = max(scores, key=scores.get)
+        threshold = max(10.0, scores[best] * 0.2)
+        parent = best.getparent()
+        blocks = [best]
+        if parent is not None:
+            blocks = [
+                sibling for sibling in parent
+                if sibling is best or scores.get(sibling, 0) >= threshold
+            ]
+        paragraphs = [p for block in blocks for p in _paragraphs(block)]
+        text = "\n".join(paragraphs)
+        if len(text) >= MIN_ARTICLE_CHARS:
+            return title, text
+
+    logger.info("No dominant content block, using the whole page text")
+    return title, "\n".join(_paragraphs(body))
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from sqlite_cache import process_wide
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent store of embedding vectors keyed by (model, sha256 of the text)"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets several bot processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+        ''')
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> dict:
+        """Return {hash: vector} for the hashes present in the cache"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay below SQLite's host parameter limit
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[h] = vector.tolist()
+        return found
+
+    def put_many(self, model: str, items: dict):
+        """Store {hash: vector}"""
+        rows = [
+            (model, h, len(vector), array("f", vector).tobytes())
+            for h, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, dim, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def sample(self, model: str, limit: int) -> List[List[float]]:
+        """Up to limit stored vectors of the model"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE model = ? LIMIT ?", (model, limit)
+            ).fetchall()
+        vectors = []
+        for (blob,) in rows:
+            vector = array("f")
+            vector.frombytes(blob)
+            vectors.append(vector.tolist())
+        return vectors
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: Optional[str] = None,
+                 query_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", EMBEDDING_MODEL)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Questions are short and repeat a lot, an in-memory LRU is enough
+        self.query_cache_size = query_cache_size
+        self._queries = OrderedDict()
+        self.query_hits = 0
+        self.query_misses = 0
+
+    def lookup(self, texts: List[str]):
+        """
+        Split texts into cached vectors and misses
+
+        Returns:
+            Tuple of (hashes, {hash: vector} found, {hash: text} missing)
+        """
+        hashes = [text_hash(t) for t in texts]
+        found = self.cache.get_many(self.model, hashes)
+
+        # Identical chunks inside one batch are embedded once
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = text
+
+        with self._lock:
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += len(missing)
+
+        if missing:
+            logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        return hashes, found, missing
+
+    def store(self, items: dict):
+        self.cache.put_many(self.model, items)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, found, missing = self.lookup(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self.store(new_items)
+            found.update(new_items)
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_hash(text)
+        with self._lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._queries[key] = vector
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "query_hits": self.query_hits,
+                "query_misses": self.query_misses
+            }
+
+
+_cache = process_wide(EmbeddingCache)
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache (opened on first use)"""
+    return _cache()
+
+
+def build_embeddings(api_key: str, chunk_size: int = 1000) -> CachedEmbeddings:
+    """OpenAI embeddings behind the shared persistent cache"""
+    embeddings = OpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        api_key=api_key,
+        base_url="https://api.proxyapi.ru/openai/v1",
+        chunk_size=chunk_size
+    )
+    return CachedEmbeddings(embeddings, get_embedding_cache(), model=EMBEDDING_MODEL)
@@ -0,0 +1,142 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+# Account limits of the embeddings endpoint
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", "1000000"))
+EMBEDDING_MAX_RETRIES = 3
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Per-minute rate limit shared by every event loop and thread of the process"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: int) -> float:
+        """Take amount from the bucket and return how long the caller has to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # A request larger than the whole bucket still goes through once it is full
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    async def acquire(self, amount: int = 1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_request_bucket = TokenBucket(EMBEDDING_RPM)
+_token_bucket = TokenBucket(EMBEDDING_TPM)
+
+
+class EmbeddingDispatcher:
+    """Embeds large text lists with concurrent, rate-limited sub-batch requests"""
+
+    def __init__(self, embeddings: Embeddings, concurrency: int = EMBEDDING_CONCURRENCY,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_retries: int = EMBEDDING_MAX_RETRIES):
+        self.embeddings = embeddings
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+    def _network_embeddings(self) -> Embeddings:
+        # The cache is checked once up front, sub-batches go straight to the model
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return self.embeddings.embeddings
+        return self.embeddings
+
+    async def _embed_batch(self, semaphore, model: Embeddings, number: int, total: int,
+                           batch: List[str], tokens: int) -> List[List[float]]:
+        last_err = None
+        for attempt in range(1, self.max_retries + 1):
+            async with semaphore:
+                await _request_bucket.acquire(1)
+                await _token_bucket.acquire(tokens)
+                try:
+                    vectors = await asyncio.to_thread(model.embed_documents, batch)
+                    logger.info(f"Embedded batch {number}/{total} ({len(batch)} chunks)")
+                    return vectors
+                except Exception as e:
+                    last_err = e
+                    logger.warning(f"Embedding batch {number} attempt {attempt} failed: {e}")
+            # Back off outside the semaphore so other batches keep going
+            await asyncio.sleep(2 * attempt)
+        raise RuntimeError(f"Failed embedding batch {number}: {last_err}")
+
+    async def aembed(self, texts: List[str], token_counts: Optional[List[Optional[int]]] = None) -> List[List[float]]:
+        """
+        Embed texts, returning vectors in the same order
+
+        token_counts, when the splitter already computed them, are used for
+        the tokens-per-minute limit instead of a length estimate.
+        """
+        if not texts:
+            return []
+        known_tokens = dict(zip(texts, token_counts)) if token_counts else {}
+
+        cached = self.embeddings if isinstance(self.embeddings, CachedEmbeddings) else None
+        if cached:
+            hashes, found, missing = cached.lookup(texts)
+            pending = list(missing.values())
+        else:
+            pending = texts
+
+        vectors = []
+        if pending:
+            model = self._network_embeddings()
+            batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+            semaphore = asyncio.Semaphore(self.concurrency)
+            logger.info(f"Dispatching {len(pending)} chunks in {len(batches)} batches "
+                        f"({self.concurrency} concurrent requests)")
+            results = await asyncio.gather(*[
+                self._embed_batch(semaphore, model, n + 1, len(batches), batch,
+                                  sum(known_tokens.get(t) or _estimate_tokens(t) for t in batch))
+                for n, batch in enumerate(batches)
+            ])
+            vectors = [v for batch_vectors in results for v in batch_vectors]
+
+        if not cached:
+            return vectors
+
+        new_items = dict(zip(missing.keys(), vectors))
+        if new_items:
+            cached.store(new_items)
+        found.update(new_items)
+        return [found[h] for h in hashes]
+
+    def embed(self, texts: List[str], token_counts: Optional[List[Optional[int]]] = None) -> List[List[float]]:
+        """Synchronous entry point for worker threads"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed(texts, token_counts))
+        # Called from inside an event loop: run on a private loop in another thread
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self.aembed(texts, token_counts)).result()
@@ -0,0 +1,151 @@
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from indexer import load_and_split, index_splits, reindex_video_transcript, reindex_pdf_stream, is_pdf_source
+from Requests import answer, get_vector_store, get_documents, prepare_answer, astream_prepared, asummarize
+from youtube_processor import process_youtube_video
+
+logger = logging.getLogger(__name__)
+
+# Thread pool for network / disk bound work (embeddings, LLM calls, index loads)
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+# Process pool for CPU bound work (PDF parsing, chunking)
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+
+class TaskExecutor:
+    """Runs blocking pipeline work off the asyncio event loop"""
+
+    def __init__(self, io_workers: int = IO_WORKERS, cpu_workers: int = CPU_WORKERS):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self._io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="rag-io")
+        self._cpu_pool = None
+        self._lock = threading.Lock()
+        self._pending = {"io": 0, "cpu": 0}
+        self._running = {"io": 0}
+
+    def _get_cpu_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._cpu_pool is None:
+                # spawn: forking a process that already runs threads (event loop, I/O pool) is unsafe
+                self._cpu_pool = ProcessPoolExecutor(
+                    max_workers=self.cpu_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"Started CPU process pool with {self.cpu_workers} workers")
+            return self._cpu_pool
+
+    def _track(self, kind: str, delta: int):
+        with self._lock:
+            self._pending[kind] += delta
+
+    def _log_backlog(self, kind: str, fn):
+        """Log the pool's depth when a newly submitted job has to wait for a free worker"""
+        depth = self.queue_depth()[kind]
+        # Jobs not yet picked up by an idle worker count as queued too, only a full pool means waiting
+        if depth["queued"] and depth["queued"] + depth["running"] > depth["workers"]:
+            logger.info(f"{kind} pool busy, {getattr(fn, '__name__', fn)} waits: "
+                        f"{depth['queued']} queued, {depth['running']}/{depth['workers']} running")
+
+    def _run_tracked(self, fn, *args, **kwargs):
+        with self._lock:
+            self._running["io"] += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running["io"] -= 1
+
+    async def run_io(self, fn, *args, **kwargs):
+        """Run a blocking I/O bound callable in the thread pool"""
+        loop = asyncio.get_running_loop()
+        self._track("io", 1)
+        self._log_backlog("io", fn)
+        try:
+            return await loop.run_in_executor(
+                self._io_pool, partial(self._run_tracked, fn, *args, **kwargs)
+            )
+        finally:
+            self._track("io", -1)
+
+    async def run_cpu(self, fn, *args, **kwargs):
+        """Run a CPU bound callable in the process pool (fn and its arguments must be picklable)"""
+        loop = asyncio.get_running_loop()
+        self._track("cpu", 1)
+        self._log_backlog("cpu", fn)
+        try:
+            return await loop.run_in_executor(self._get_cpu_pool(), partial(fn, *args, **kwargs))
+        finally:
+            self._track("cpu", -1)
+
+    def queue_depth(self) -> dict:
+        """Number of queued and running jobs per pool"""
+        with self._lock:
+            io_pending, io_running = self._pending["io"], self._running["io"]
+            cpu_pending = self._pending["cpu"]
+        cpu_running = min(cpu_pending, self.cpu_workers)
+        return {
+            "io": {"queued": max(0, io_pending - io_running), "running": io_running, "workers": self.io_workers},
+            "cpu": {"queued": cpu_pending - cpu_running, "running": cpu_running, "workers": self.cpu_workers}
+        }
+
+    def shutdown(self, wait: bool = True):
+        logger.info("Shutting down task executor...")
+        self._io_pool.shutdown(wait=wait, cancel_futures=not wait)
+        with self._lock:
+            if self._cpu_pool is not None:
+                self._cpu_pool.shutdown(wait=wait, cancel_futures=not wait)
+                self._cpu_pool = None
+
+
+executor = TaskExecutor()
+
+
+# Awaitable wrappers for the pipeline entry points
+
+async def areindex(source: str, chat_id=None, source_name: str = None) -> int:
+    if is_pdf_source(source):
+        # Parsing and embedding overlap inside one streaming pipeline
+        return await executor.run_io(reindex_pdf_stream, source, chat_id=chat_id, source_name=source_name)
+    if source.startswith(('http://', 'https://')):
+        # Fetching the article dominates, keep it in a thread
+        splits = await executor.run_io(load_and_split, source)
+    else:
+        splits = await executor.run_cpu(load_and_split, source)
+    return await executor.run_io(index_splits, splits, source, chat_id=chat_id, source_name=source_name)
+
+
+async def areindex_video_transcript(video_title: str, transcript: str, video_info: str = "", chat_id=None) -> int:
+    return await executor.run_io(reindex_video_transcript, video_title, transcript, video_info, chat_id=chat_id)
+
+
+async def aanswer(question: str, prompt: str = None, chat_id=None) -> str:
+    return await executor.run_io(answer, question, prompt, chat_id=chat_id)
+
+
+async def aanswer_stream(question: str, prompt: str = None, chat_id=None):
+    """Async generator of answer pieces; retrieval runs in the thread pool, generation streams natively"""
+    prepared = await executor.run_io(prepare_answer, question, prompt, chat_id=chat_id)
+    async for piece in astream_prepared(prepared):
+        yield piece
+
+
+async def asummarize_documents(prompt: str, chat_id=None) -> str:
+    """Summary of the chat's whole knowledge base; chunks are read and counted in the thread pool, LLM calls run concurrently here"""
+    docs = await executor.run_io(get_documents, chat_id)
+    return await asummarize(docs, prompt, run_io=executor.run_io)
+
+
+async def aget_vector_store(chat_id=None):
+    return await executor.run_io(get_vector_store, chat_id)
+
+
+async def aprocess_youtube_video(url: str):
+    # The download is I/O; Whisper runs in the transcription service's own worker processes
+    return await executor.run_io(process_youtube_video, url)
@@ -0,0 +1,193 @@
+import os
+import logging
+from typing import Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# RAM a single knowledge base's vector index may use
+INDEX_MEMORY_BUDGET_MB = int(os.getenv("INDEX_MEMORY_BUDGET_MB", "512"))
+# Exact search stays fast enough up to this many vectors
+FLAT_MAX_VECTORS = int(os.getenv("FLAT_MAX_VECTORS", "20000"))
+# IVF-PQ needs enough vectors to train its quantizers
+IVFPQ_MIN_VECTORS = 10000
+# Embeddings are cut to their first N components and renormalized (0 keeps the model's size).
+# text-embedding-3 models are trained so that such prefixes stay usable embeddings.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+# Component type of Flat and HNSW indexes: float32, float16 or int8 (scalar quantized)
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32").lower()
+_STORAGE_BYTES = {"float32": 4, "float16": 2, "int8": 1}
+if VECTOR_STORAGE not in _STORAGE_BYTES:
+    logger.warning(f"Unknown VECTOR_STORAGE '{VECTOR_STORAGE}', using float32")
+    VECTOR_STORAGE = "float32"
+# int8 ranges are learned per dimension and widened by this share, so later additions rarely clip
+SQ_RANGE_MARGIN = 0.2
+# Smaller corpora stay float32: ranges learned from a handful of vectors would clip most later ones
+INT8_MIN_VECTORS = 1000
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 32
+# Trained indexes (IVF-PQ, int8) are retrained once the corpus outgrows their training set this much
+RETRAIN_GROWTH = 4
+
+_TIERS = ("flat", "hnsw", "ivfpq")
+FLAT_SPEC = {"type": "flat"}
+_SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def target_dimensions(dim: int) -> int:
+    """Dimensions vectors are stored with, for embeddings of dim components"""
+    return min(EMBEDDING_DIMENSIONS, dim) if EMBEDDING_DIMENSIONS > 0 else dim
+
+
+def reduce_dimensions(vectors, dim: int) -> np.ndarray:
+    """Keep the first dim components of each vector and scale them back to unit length"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[-1] <= dim:
+        return vectors
+    vectors = vectors[..., :dim]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.where(norms == 0, 1.0, norms))
+
+
+def _storage(spec: Optional[dict]) -> str:
+    return (spec or FLAT_SPEC).get("storage", "float32")
+
+
+def _flat_bytes(count: int, dim: int, storage: str) -> int:
+    return count * dim * _STORAGE_BYTES[storage]
+
+
+def _hnsw_bytes(count: int, dim: int, storage: str) -> int:
+    # Stored vectors plus ~2*M neighbour links per vector on the base layer
+    return count * (dim * _STORAGE_BYTES[storage] + HNSW_M * 2 * 4)
+
+
+def _pq_subquantizers(dim: int) -> int:
+    for m in (64, 48, 32, 24, 16, 8, 4, 2):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def choose_index_spec(count: int, dim: int, budget_mb: int = INDEX_MEMORY_BUDGET_MB,
+                      storage: str = VECTOR_STORAGE) -> dict:
+    """Pick the index type for a corpus size: exact Flat, HNSW while it fits the budget, IVF-PQ beyond"""
+    budget = budget_mb * 1024 * 1024
+    if storage == "int8" and count < INT8_MIN_VECTORS:
+        storage = "float32"
+    # int8 ranges, like IVF-PQ quantizers, are learned from the vectors present at build time
+    trained = {"trained_on": count} if storage == "int8" else {}
+    if count <= FLAT_MAX_VECTORS and _flat_bytes(count, dim, storage) <= budget:
+        return {"type": "flat", "storage": storage, **trained}
+    if _hnsw_bytes(count, dim, storage) <= budget or count < IVFPQ_MIN_VECTORS:
+        return {"type": "hnsw", "M": HNSW_M, "ef_search": HNSW_EF_SEARCH, "storage": storage, **trained}
+    # ~4*sqrt(n) inverted lists, rounded to a power of two
+    nlist = int(2 ** round(np.log2(4 * np.sqrt(count))))
+    return {
+        "type": "ivfpq",
+        "nlist": max(64, min(nlist, 65536)),
+        "m": _pq_subquantizers(dim),
+        "nprobe": IVF_NPROBE,
+        "trained_on": count
+    }
+
+
+def needs_rebuild(spec: Optional[dict], count: int, dim: int) -> Optional[dict]:
+    """
+    The spec to rebuild with, or None if the current index still fits the corpus
+
+    Upgrades happen as soon as the corpus crosses a threshold; downgrades
+    only once it has shrunk to half of it, so indexes don't flip back and
+    forth around a boundary. A changed VECTOR_STORAGE applies right away,
+    and trained indexes are retrained as the corpus grows past RETRAIN_GROWTH.
+    """
+    spec = spec or FLAT_SPEC
+    current = spec["type"]
+    desired = choose_index_spec(count, dim)
+    if desired["type"] == current:
+        # int8 indexes saved without a training size may have learned their ranges from a single chunk
+        trained_on = spec.get("trained_on", 0 if _storage(spec) == "int8" else count)
+        if count > RETRAIN_GROWTH * trained_on:
+            return desired
+        if current != "ivfpq" and _storage(spec) != desired["storage"]:
+            return desired
+        return None
+    if _TIERS.index(desired["type"]) > _TIERS.index(current):
+        return desired
+    if choose_index_spec(count * 2, dim)["type"] != current:
+        return desired
+    return None
+
+
+def supports_removal(spec: Optional[dict]) -> bool:
+    # HNSW graphs cannot drop vectors, and IVF-PQ remove_ids leaves positions unrenumbered while
+    # the store compacts its position -> id mapping: removals rebuild those indexes instead
+    return (spec or FLAT_SPEC)["type"] not in ("hnsw", "ivfpq")
+
+
+def reconstructs_exactly(spec: Optional[dict]) -> bool:
+    # PQ and int8 codes only give approximate vectors back
+    return (spec or FLAT_SPEC)["type"] != "ivfpq" and _storage(spec) != "int8"
+
+
+def _train_scalar_quantizer(index: faiss.Index, quantizer, vectors: np.ndarray):
+    if not index.is_trained:
+        quantizer.rangestat = faiss.ScalarQuantizer.RS_minmax
+        quantizer.rangestat_arg = SQ_RANGE_MARGIN
+        index.train(vectors)
+
+
+def build_index(spec: dict, vectors: np.ndarray) -> faiss.Index:
+    """
+    Create an L2 index of the given spec (the distance LangChain's FAISS store defaults to) holding vectors
+
+    float16/int8 storage and IVF-PQ are trained on vectors, so those need at least one.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    storage = _storage(spec)
+    if spec["type"] == "flat" and storage == "float32":
+        index = faiss.IndexFlatL2(dim)
+    elif spec["type"] == "flat":
+        index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[storage], faiss.METRIC_L2)
+        _train_scalar_quantizer(index, index.sq, vectors)
+    elif spec["type"] == "hnsw":
+        if storage == "float32":
+            index = faiss.IndexHNSWFlat(dim, spec["M"])
+        else:
+            index = faiss.IndexHNSWSQ(dim, _SQ_TYPES[storage], spec["M"], faiss.METRIC_L2)
+            _train_scalar_quantizer(index, faiss.downcast_index(index.storage).sq, vectors)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = spec["ef_search"]
+    elif spec["type"] == "ivfpq":
+        index = faiss.index_factory(dim, f"IVF{spec['nlist']},PQ{spec['m']}", faiss.METRIC_L2)
+        # Train the quantizers on a sample: enough points per centroid, not the whole corpus
+        sample_size = min(count, max(39 * spec["nlist"], 256 * 39))
+        sample = vectors[np.random.RandomState(0).choice(count, sample_size, replace=False)]
+        logger.info(f"Training IVF-PQ quantizers on {sample_size} of {count} vectors")
+        index.train(sample)
+        index.nprobe = spec["nprobe"]
+    else:
+        raise ValueError(f"Unknown index type: {spec['type']}")
+    index.add(vectors)
+    return index
+
+
+def refill_index(index: faiss.Index, vectors: np.ndarray) -> faiss.Index:
+    """An empty copy of a trained index (same quantizers, no retraining) holding vectors"""
+    index = faiss.clone_index(index)
+    index.reset()
+    index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    return index
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """All vectors of a Flat or HNSW index, in position order (approximate for int8 storage)"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
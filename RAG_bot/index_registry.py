@@ -0,0 +1,334 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+from vector_cache import invalidate_index
+from kb_store import INDEX_FILE, load_store, save_store
+from answer_cache import invalidate_answers
+from bm25_index import BM25Index
+from embedding_dispatcher import EmbeddingDispatcher
+from index_factory import (
+    FLAT_SPEC, choose_index_spec, needs_rebuild, supports_removal, reconstructs_exactly,
+    build_index, refill_index, reconstruct_all, reduce_dimensions, target_dimensions
+)
+
+logger = logging.getLogger(__name__)
+
+# On-disk layout:
+#   faiss_index/
+#     chat_<chat_id>/
+#       manifest.json     # sources of the knowledge base, their chunk ids and the index type
+#       kb/index.faiss    # one incremental FAISS index per chat
+#       kb/docstore.*     # chunk texts and metadata (arena format, see kb_store)
+#       kb/bm25.json      # keyword index over the same chunks
+#     .chat_<chat_id>.lock  # held by the process writing that knowledge base
+INDEX_ROOT = os.getenv("FAISS_INDEX_ROOT", "./faiss_index")
+MANIFEST_FILE = "manifest.json"
+KB_DIR = "kb"
+DEFAULT_NAMESPACE = "default"
+
+
+def document_id(source: str) -> str:
+    """Stable document id derived from the source (URL, file name, video title)"""
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_ids(source_id: str, count: int, start: int = 0) -> List[str]:
+    """Stable docstore ids of a source's chunks"""
+    return [f"{source_id}-{n}" for n in range(start, start + count)]
+
+
+def _namespace_name(chat_id) -> str:
+    if chat_id is None:
+        return DEFAULT_NAMESPACE
+    return "chat_" + re.sub(r"[^0-9A-Za-z_-]", "_", str(chat_id))
+
+
+class IndexRegistry:
+    """Per-chat incremental knowledge bases with a manifest of their sources"""
+
+    def __init__(self, root: str = INDEX_ROOT):
+        self.root = root
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def _write_lock(self, chat_id):
+        """
+        Serialize writes to a chat's knowledge base across threads and processes
+
+        save_store appends to an arena shared with the live version, so two
+        writers (bot processes, indexing scripts) must never overlap.
+        """
+        with self._lock_for(self.namespace_dir(chat_id)):
+            os.makedirs(self.root, exist_ok=True)
+            # Outside the namespace dir, which remove() deletes
+            with open(os.path.join(self.root, f".{_namespace_name(chat_id)}.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def namespace_dir(self, chat_id) -> str:
+        return os.path.join(self.root, _namespace_name(chat_id))
+
+    def index_dir(self, chat_id) -> str:
+        return os.path.join(self.namespace_dir(chat_id), KB_DIR)
+
+    def _read(self, chat_id) -> dict:
+        path = os.path.join(self.namespace_dir(chat_id), MANIFEST_FILE)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"sources": {}}
+        except Exception as e:
+            logger.error(f"Corrupted index manifest {path}: {str(e)}")
+            return {"sources": {}}
+
+    def _write(self, chat_id, manifest: dict):
+        ns_dir = self.namespace_dir(chat_id)
+        os.makedirs(ns_dir, exist_ok=True)
+        path = os.path.join(ns_dir, MANIFEST_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def _load_for_write(self, chat_id, embeddings) -> Optional[FAISS]:
+        # Writers get their own copy, the cached instance keeps serving readers
+        index_dir = self.index_dir(chat_id)
+        if not os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+            return None
+        return load_store(index_dir, embeddings, writable=True)
+
+    def _load_keyword_index(self, chat_id, vector_store: Optional[FAISS]) -> BM25Index:
+        """The keyword index to update along with the store, built once for stores saved without one"""
+        if vector_store is None:
+            return BM25Index([], [], {})
+        return BM25Index.load(self.index_dir(chat_id)) or BM25Index.from_vector_store(vector_store)
+
+    def _texts(self, vector_store: FAISS, ids: List[str]) -> List[Tuple[str, str]]:
+        """(id, text) of the chunks still in the docstore"""
+        docs = ((doc_id, vector_store.docstore.search(doc_id)) for doc_id in ids)
+        return [(doc_id, doc.page_content) for doc_id, doc in docs if isinstance(doc, Document)]
+
+    def _save(self, chat_id, vector_store: Optional[FAISS], keyword_index: Optional[BM25Index] = None):
+        """Swap the knowledge base in through a staging directory so readers never see a partial index"""
+        index_dir = self.index_dir(chat_id)
+        suffix = f"{os.getpid()}.{threading.get_ident()}"
+        old_dir = None
+        staging_dir = None
+        if vector_store is not None:
+            staging_dir = f"{index_dir}.{suffix}.staging"
+            save_store(vector_store, staging_dir)
+            keyword_index.save(staging_dir)
+        if os.path.exists(index_dir):
+            old_dir = f"{index_dir}.{suffix}.old"
+            os.replace(index_dir, old_dir)
+        if staging_dir:
+            os.replace(staging_dir, index_dir)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        invalidate_index(index_dir)
+        invalidate_answers(index_dir)
+
+    def _embedded_vectors(self, vector_store: FAISS, positions: List[int], embeddings, dim: int) -> np.ndarray:
+        """Vectors of the chunks at the given index positions, back from the embedding cache"""
+        if not positions:
+            return np.zeros((0, dim), dtype=np.float32)
+        mapping = vector_store.index_to_docstore_id
+        texts = [vector_store.docstore.search(mapping[position]).page_content for position in positions]
+        return reduce_dimensions(EmbeddingDispatcher(embeddings).embed(texts), dim)
+
+    def _stored_vectors(self, vector_store: FAISS, positions: List[int], spec: Optional[dict],
+                        embeddings) -> np.ndarray:
+        if reconstructs_exactly(spec):
+            return reconstruct_all(vector_store.index)[positions]
+        # Original vectors come back from the embedding cache
+        return self._embedded_vectors(vector_store, positions, embeddings, vector_store.index.d)
+
+    def _remove_ids(self, vector_store: FAISS, ids: List[str], spec: Optional[dict], embeddings) -> Optional[dict]:
+        """Drop chunks from the store, returning the index spec in effect afterwards"""
+        if supports_removal(spec):
+            vector_store.delete(ids)
+            return spec
+        # HNSW and IVF-PQ indexes cannot drop vectors in place: rebuild from the remaining ones
+        remove = set(ids)
+        mapping = vector_store.index_to_docstore_id
+        keep = [position for position in sorted(mapping) if mapping[position] not in remove]
+        vectors = self._stored_vectors(vector_store, keep, spec, embeddings)
+        stored = set(mapping.values())
+        vector_store.docstore.delete([i for i in remove if i in stored])
+        vector_store.index_to_docstore_id = {new: mapping[old] for new, old in enumerate(keep)}
+        if not keep:
+            # Nothing to train quantizers on, start over from an empty Flat index
+            spec = None
+        elif spec["type"] == "ivfpq":
+            # The quantizers still describe the remaining vectors, only the lists are refilled
+            vector_store.index = refill_index(vector_store.index, vectors)
+            return spec
+        vector_store.index = build_index(spec or FLAT_SPEC, vectors)
+        return spec
+
+    def _change_dimensions(self, vector_store: FAISS, dim: int, embeddings) -> Optional[dict]:
+        """Re-embed the knowledge base after EMBEDDING_DIMENSIONS changed"""
+        count = vector_store.index.ntotal
+        logger.info(f"🔁 Re-embedding {count} chunks at {dim} dimensions (was {vector_store.index.d})")
+        spec = choose_index_spec(count, dim) if count else None
+        vectors = self._embedded_vectors(vector_store, sorted(vector_store.index_to_docstore_id), embeddings, dim)
+        vector_store.index = build_index(spec or FLAT_SPEC, vectors)
+        return spec
+
+    def _fit_index(self, vector_store: FAISS, spec: Optional[dict], embeddings) -> Optional[dict]:
+        """Rebuild the index as another type once the corpus crosses a size threshold"""
+        count, dim = vector_store.index.ntotal, vector_store.index.d
+        new_spec = needs_rebuild(spec, count, dim)
+        if new_spec is None:
+            return spec or dict(FLAT_SPEC)
+        logger.info(f"🔁 Rebuilding index of {count} vectors as {new_spec['type']} ({new_spec.get('storage', 'pq')})")
+        vectors = self._stored_vectors(vector_store, sorted(vector_store.index_to_docstore_id), spec, embeddings)
+        vector_store.index = build_index(new_spec, vectors)
+        return new_spec
+
+    def add_source(self, chat_id, source_id: str, source: str, source_type: str,
+                   texts: List[str], vectors: List[List[float]], metadatas: List[dict],
+                   embeddings) -> int:
+        """
+        Add a source's chunks to the chat's knowledge base
+
+        Only the new vectors are added; a source that is already indexed is
+        replaced by deleting its previous chunks first.
+        """
+        return self.add_source_batches(
+            chat_id, source_id, source, source_type, [(texts, vectors, metadatas)], embeddings
+        )
+
+    def add_source_batches(self, chat_id, source_id: str, source: str, source_type: str,
+                           batches: Iterable[Tuple[List[str], List[List[float]], List[dict]]],
+                           embeddings) -> int:
+        """
+        Append a source's chunks batch by batch as (texts, vectors, metadatas) arrive
+
+        The knowledge base is saved once after the last batch, so readers see
+        either the old or the complete new version of the source.
+        """
+        with self._write_lock(chat_id):
+            manifest = self._read(chat_id)
+            vector_store = self._load_for_write(chat_id, embeddings)
+            spec = manifest.get("index") if vector_store is not None else None
+            keyword_index = self._load_keyword_index(chat_id, vector_store)
+
+            previous = manifest["sources"].get(source_id)
+            if vector_store is not None and previous:
+                logger.info(f"Replacing {len(previous['ids'])} chunks of source {source_id}")
+                keyword_index.remove(self._texts(vector_store, previous["ids"]))
+                spec = self._remove_ids(vector_store, previous["ids"], spec, embeddings)
+
+            ids = []
+            for texts, vectors, metadatas in batches:
+                if not texts:
+                    continue
+                vectors = reduce_dimensions(vectors, target_dimensions(len(vectors[0])))
+                if vector_store is not None and vector_store.index.d != vectors.shape[1]:
+                    spec = self._change_dimensions(vector_store, vectors.shape[1], embeddings)
+                batch_ids = chunk_ids(source_id, len(texts), start=len(ids))
+                metadatas = [{**m, "source_id": source_id} for m in metadatas]
+                if vector_store is None:
+                    vector_store = FAISS.from_embeddings(
+                        list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=batch_ids
+                    )
+                else:
+                    vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=batch_ids)
+                keyword_index.add(zip(batch_ids, texts))
+                ids.extend(batch_ids)
+
+            if not ids:
+                raise ValueError("No chunks were created after splitting")
+
+            manifest["index"] = self._fit_index(vector_store, spec, embeddings)
+            self._save(chat_id, vector_store, keyword_index)
+            manifest["sources"][source_id] = {
+                "source": source,
+                "type": source_type,
+                "chunks": len(ids),
+                "ids": ids,
+                "added_at": time.time()
+            }
+            self._write(chat_id, manifest)
+
+        logger.info(f"💾 Added {len(ids)} chunks of {source_id} to namespace {_namespace_name(chat_id)}")
+        return len(ids)
+
+    def remove_source(self, chat_id, source_id: str, embeddings) -> bool:
+        """Delete only the vectors and docstore entries of one source"""
+        with self._write_lock(chat_id):
+            manifest = self._read(chat_id)
+            entry = manifest["sources"].pop(source_id, None)
+            if entry is None:
+                return False
+
+            vector_store = self._load_for_write(chat_id, embeddings)
+            keyword_index = None
+            if vector_store is not None:
+                if manifest["sources"]:
+                    keyword_index = self._load_keyword_index(chat_id, vector_store)
+                    keyword_index.remove(self._texts(vector_store, entry["ids"]))
+                    spec = manifest.get("index")
+                    spec = self._remove_ids(vector_store, entry["ids"], spec, embeddings)
+                    manifest["index"] = self._fit_index(vector_store, spec, embeddings)
+                else:
+                    vector_store = None
+                    manifest.pop("index", None)
+            self._save(chat_id, vector_store, keyword_index)
+            self._write(chat_id, manifest)
+
+        logger.info(f"Removed source {source_id} from namespace {_namespace_name(chat_id)}")
+        return True
+
+    def resolve(self, chat_id) -> Optional[str]:
+        """Return the chat's knowledge base directory, or None if nothing is indexed"""
+        index_dir = self.index_dir(chat_id)
+        if not os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+            return None
+        return index_dir
+
+    def list_sources(self, chat_id) -> dict:
+        return self._read(chat_id)["sources"]
+
+    def remove(self, chat_id) -> bool:
+        """Remove the chat's whole namespace"""
+        ns_dir = self.namespace_dir(chat_id)
+        with self._write_lock(chat_id):
+            if not os.path.exists(ns_dir):
+                return False
+            shutil.rmtree(ns_dir, ignore_errors=True)
+            invalidate_index(self.index_dir(chat_id))
+            invalidate_answers(self.index_dir(chat_id))
+            return True
+
+
+registry = IndexRegistry()
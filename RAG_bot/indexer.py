@@ -1,33 +1,27 @@
 import os
+import queue
 import logging
-import bs4
-import tiktoken
+import threading
 from dotenv import load_dotenv
-from langchain_community.document_loaders import WebBaseLoader, PyPDFLoader, TextLoader
+from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
+from index_registry import registry, document_id
+from embedding_cache import build_embeddings
+from embedding_dispatcher import EmbeddingDispatcher
+from tokenizer_service import tokenizer
+from pdf_extractor import pdf_extractor
+from article_fetcher import article_fetcher, decode_body
+from content_extractor import extract_article, EXTRACTOR_VERSION
+from chunk_dedup import dedup_chunks, ChunkDeduplicator, threshold_for, DEDUP_ENABLED
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-def _clean_html(content: str) -> str:
-    """Remove unnecessary HTML tags and scripts while preserving main content."""
-    soup = bs4.BeautifulSoup(content, "html.parser")
-    
-    for element in soup(["script", "style", "nav", "footer", "iframe", "aside", "header", "meta", "link"]):
-        element.decompose()
-    
-    return soup.get_text(separator="\n", strip=True)
-
-def _count_tokens(text: str, model: str = "text-embedding-3-small") -> int:
-    """Count tokens in text for a specific model."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except:
-        return len(text) // 4
+# Chunks embedded and appended per step of streaming PDF ingestion
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "400"))
+# Batches parsed ahead while the current one is being embedded
+INGEST_PREFETCH_BATCHES = 2
 
 def _validate_file_source(source: str) -> None:
     """Validate file source before processing."""
@@ -46,17 +40,53 @@ def _validate_file_source(source: str) -> None:
     if file_size > MAX_FILE_SIZE:
         raise ValueError(f"File too large ({file_size/1024/1024:.1f}MB). Max size: 20MB")
 
+def is_pdf_source(source: str) -> bool:
+    return not source.startswith(('http://', 'https://')) and source.split('.')[-1].lower() == 'pdf'
+
+def _split_sentences(split, max_tokens: int) -> list:
+    """Pack the sentences of an oversized split into parts, keeping a running token total."""
+    sentences = split.page_content.split('. ')
+    sentence_tokens = tokenizer.count_batch(sentences)
+    # ". " between sentences; tokens merge slightly at the joins, so this is an upper bound
+    separator_tokens = 1
+    
+    parts = []
+    current, current_tokens = [], 0
+    for sentence, tokens in zip(sentences, sentence_tokens):
+        added = tokens + (separator_tokens if current else 0)
+        if current and current_tokens + added > max_tokens:
+            parts.append(type(split)(
+                page_content=". ".join(current),
+                metadata={**split.metadata, "token_count": current_tokens}
+            ))
+            current, current_tokens = [sentence], tokens
+        else:
+            current.append(sentence)
+            current_tokens += added
+    if current:
+        parts.append(type(split)(
+            page_content=". ".join(current),
+            metadata={**split.metadata, "token_count": current_tokens}
+        ))
+    return parts
+
 def _split_large_document(docs, max_tokens=250000):
-    """Split document into smaller parts if it exceeds token limit."""
+    """Split documents that exceed the token limit into smaller parts.
+    
+    Every text is tokenized once; the counts are kept in metadata["token_count"].
+    """
     if not docs:
         return docs
     
-    total_tokens = _count_tokens(docs[0].page_content)
+    for doc, tokens in zip(docs, tokenizer.count_batch([doc.page_content for doc in docs])):
+        doc.metadata["token_count"] = tokens
     
-    if total_tokens <= max_tokens:
+    large = [doc for doc in docs if doc.metadata["token_count"] > max_tokens]
+    if not large:
         return docs
     
-    logger.warning(f"Document too large ({total_tokens} tokens). Splitting into smaller parts...")
+    logger.warning(f"Document too large ({max(d.metadata['token_count'] for d in large)} tokens). "
+                   "Splitting into smaller parts...")
     
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
@@ -65,34 +95,118 @@ def _split_large_document(docs, max_tokens=250000):
         separators=["\n\n", "\n", ". ", " ", ""]
     )
     
-    splits = text_splitter.split_documents(docs)
-    
     final_splits = []
-    for split in splits:
-        split_tokens = _count_tokens(split.page_content)
-        if split_tokens > max_tokens:
-            sentences = split.page_content.split('. ')
-            current_chunk = ""
-            for sentence in sentences:
-                sentence_tokens = _count_tokens(sentence)
-                if _count_tokens(current_chunk) + sentence_tokens > max_tokens:
-                    if current_chunk:
-                        new_doc = type(split)(page_content=current_chunk, metadata=split.metadata.copy())
-                        final_splits.append(new_doc)
-                    current_chunk = sentence
-                else:
-                    current_chunk += ". " + sentence if current_chunk else sentence
-            if current_chunk:
-                new_doc = type(split)(page_content=current_chunk, metadata=split.metadata.copy())
-                final_splits.append(new_doc)
-        else:
-            final_splits.append(split)
+    for doc in docs:
+        if doc.metadata["token_count"] <= max_tokens:
+            final_splits.append(doc)
+            continue
+        splits = text_splitter.split_documents([doc])
+        for split, tokens in zip(splits, tokenizer.count_batch([s.page_content for s in splits])):
+            if tokens > max_tokens:
+                final_splits.extend(_split_sentences(split, max_tokens))
+            else:
+                split.metadata["token_count"] = tokens
+                final_splits.append(split)
     
     logger.info(f"Split large document into {len(final_splits)} parts")
     return final_splits
 
-def reindex_video_transcript(video_title: str, transcript: str, video_info: str = "") -> int:
-    """Index video transcript content."""
+def _split_into_chunks(docs) -> list:
+    """Split documents into retrieval chunks annotated with their token counts."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=800,
+        chunk_overlap=150,
+        length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    splits = text_splitter.split_documents(docs)
+    for split, tokens in zip(splits, tokenizer.count_batch([s.page_content for s in splits])):
+        split.metadata["token_count"] = tokens
+    return splits
+
+def _iter_pdf_chunks(source: str):
+    """Yield the chunks of a PDF page by page, never holding the whole document."""
+    for page in pdf_extractor.extract(source):
+        if not page.page_content.strip():
+            continue
+        yield from _split_into_chunks(_split_large_document([page]))
+
+def _batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _prefetch(items, depth: int = INGEST_PREFETCH_BATCHES):
+    """Produce items in a background thread, keeping at most depth of them ready."""
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+    
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+    
+    threading.Thread(target=produce, daemon=True, name="ingest-prefetch").start()
+    try:
+        while True:
+            item = ready.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Consumer failed or stopped early: let the producer exit
+        stop.set()
+
+def _load_article(url: str) -> Document:
+    """Fetch an article through the shared HTTP client; unchanged pages reuse their extracted text."""
+    page = article_fetcher.fetch(url)
+    if page["extracted"] is not None and page["extractor"] == EXTRACTOR_VERSION:
+        logger.info("Page unchanged, reusing extracted text")
+        return Document(page_content=page["extracted"], metadata={"source": url})
+    
+    _, text = extract_article(decode_body(page))
+    article_fetcher.set_extracted(url, text, EXTRACTOR_VERSION)
+    return Document(page_content=text, metadata={"source": url})
+
+def _add_to_knowledge_base(splits, embeddings, chat_id, source: str, source_type: str) -> int:
+    """Drop near-duplicate chunks, embed the rest concurrently and add their vectors to the chat's knowledge base."""
+    splits = dedup_chunks(splits, source_type)
+    texts = [split.page_content for split in splits]
+    metadatas = [split.metadata for split in splits]
+    token_counts = [m.get("token_count") for m in metadatas]
+    
+    logger.info(f"📊 Embedding {len(texts)} chunks...")
+    vectors = EmbeddingDispatcher(embeddings).embed(texts, token_counts)
+    
+    logger.info("💾 Updating knowledge base...")
+    return registry.add_source(
+        chat_id, document_id(source), source, source_type,
+        texts, vectors, metadatas, embeddings
+    )
+
+def reindex_video_transcript(video_title: str, transcript: str, video_info: str = "", chat_id=None) -> int:
+    """Index video transcript content into the chat's namespace."""
     try:
         if not transcript or not transcript.strip():
             raise ValueError("No transcript content provided")
@@ -111,13 +225,7 @@ def reindex_video_transcript(video_title: str, transcript: str, video_info: str
         
         # Split the transcript into chunks
         logger.info("✂️ Splitting transcript into chunks...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=150,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        splits = text_splitter.split_documents(docs)
+        splits = _split_into_chunks(docs)
         
         if not splits:
             raise ValueError("No chunks were created after splitting")
@@ -134,12 +242,7 @@ def reindex_video_transcript(video_title: str, transcript: str, video_info: str
         last_err = None
         for attempt in range(1, 4):
             try:
-                embeddings = OpenAIEmbeddings(
-                    model="text-embedding-3-small",
-                    api_key=api_key,
-                    base_url="https://api.proxyapi.ru/openai/v1",
-                    chunk_size=100
-                )
+                embeddings = build_embeddings(api_key, chunk_size=100)
                 break
             except Exception as e:
                 last_err = e
@@ -148,86 +251,28 @@ def reindex_video_transcript(video_title: str, transcript: str, video_info: str
         else:
             raise RuntimeError(f"Failed to initialize embeddings: {last_err}")
         
-        logger.info("📊 Creating FAISS vector store...")
+        count = _add_to_knowledge_base(splits, embeddings, chat_id, metadata["source"], "youtube")
         
-        if len(splits) > 1000:
-            logger.info(f"Processing {len(splits)} chunks in batches...")
-            batch_size = 500
-            vector_store = None
-            
-            for i in range(0, len(splits), batch_size):
-                batch = splits[i:i + batch_size]
-                logger.info(f"Processing batch {i//batch_size + 1}/{(len(splits)-1)//batch_size + 1}")
-                
-                # Retry per batch to handle transient timeouts
-                last_err = None
-                for attempt in range(1, 4):
-                    try:
-                        if vector_store is None:
-                            vector_store = FAISS.from_documents(batch, embeddings)
-                        else:
-                            vector_store.add_documents(batch)
-                        break
-                    except Exception as e:
-                        last_err = e
-                        logger.warning(f"Batch {i//batch_size + 1} attempt {attempt} failed: {e}")
-                        sleep(2 * attempt)
-                else:
-                    raise RuntimeError(f"Failed processing batch {i//batch_size + 1}: {last_err}")
-        else:
-            # Single-shot with retry
-            last_err = None
-            for attempt in range(1, 4):
-                try:
-                    vector_store = FAISS.from_documents(splits, embeddings)
-                    break
-                except Exception as e:
-                    last_err = e
-                    logger.warning(f"Vector store build attempt {attempt} failed: {e}")
-                    sleep(2 * attempt)
-            else:
-                raise RuntimeError(f"Failed to build vector store: {last_err}")
-        
-        index_dir = "./faiss_index"
-        os.makedirs(index_dir, exist_ok=True)
-        
-        logger.info("💾 Saving vector store...")
-        vector_store.save_local(index_dir)
-        
-        logger.info(f"✅ Created vector store with {len(splits)} chunks from video transcript")
-        return len(splits)
+        logger.info(f"✅ Indexed {count} chunks from video transcript")
+        return count
         
     except Exception as e:
         logger.error(f"Video transcript indexing failed: {str(e)}")
         raise RuntimeError(f"Video transcript indexing failed: {str(e)}")
 
-def reindex(source: str) -> int:
-    """Reindex content from URL or file."""
+def load_and_split(source: str) -> list:
+    """Load content from URL or file and split it into chunks (no network calls to OpenAI)."""
     try:
         if source.startswith(('http://', 'https://')):
             logger.info(f"📥 Loading article: {source}")
-            
-            loader = WebBaseLoader(
-                web_paths=(source,),
-                requests_kwargs={
-                    "headers": {
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                    }
-                }
-            )
-            
-            docs = loader.load()
-            
-            if docs:
-                docs[0].page_content = _clean_html(docs[0].page_content)
+            docs = [_load_article(source)]
         else:
             _validate_file_source(source)
             file_ext = source.split('.')[-1].lower()
             
             if file_ext == 'pdf':
                 logger.info(f"📥 Loading PDF file: {source}")
-                loader = PyPDFLoader(source)
-                docs = loader.load()
+                docs = list(pdf_extractor.extract(source))
             
             elif file_ext == 'txt':
                 logger.info(f"📥 Loading TXT file: {source}")
@@ -242,102 +287,144 @@ def reindex(source: str) -> int:
         
         docs = _split_large_document(docs, max_tokens=250000)
         
-        total_tokens = sum(_count_tokens(doc.page_content) for doc in docs)
+        total_tokens = sum(doc.metadata["token_count"] for doc in docs)
         logger.info(f"📄 Loaded document with {total_tokens} total tokens")
         
         logger.info("✂️ Splitting document into chunks...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=150,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        splits = text_splitter.split_documents(docs)
+        splits = _split_into_chunks(docs)
         
         if not splits:
             raise ValueError("No chunks were created after splitting")
         
         logger.info(f"Created {len(splits)} chunks")
+        return splits
         
+    except Exception as e:
+        logger.error(f"Indexing failed: {str(e)}")
+        raise RuntimeError(f"Indexing failed: {str(e)}")
+
+def index_splits(splits: list, source: str, chat_id=None, source_name: str = None) -> int:
+    """Embed prepared chunks and save them as a document of the chat's namespace."""
+    try:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise RuntimeError("OPENAI_API_KEY not found in environment variables")
         
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=api_key,
-            base_url="https://api.proxyapi.ru/openai/v1",
-            chunk_size=100
-        )
+        embeddings = build_embeddings(api_key, chunk_size=100)
         
-        logger.info("📊 Creating FAISS vector store...")
+        # Temp upload paths differ per update, so files are keyed by their original name
+        source_name = source_name or source
+        source_type = 'url' if source.startswith(('http://', 'https://')) else 'file'
         
-        if len(splits) > 1000:
-            logger.info(f"Processing {len(splits)} chunks in batches...")
-            batch_size = 500
-            vector_store = None
-            
-            for i in range(0, len(splits), batch_size):
-                batch = splits[i:i + batch_size]
-                logger.info(f"Processing batch {i//batch_size + 1}/{(len(splits)-1)//batch_size + 1}")
-                
-                if vector_store is None:
-                    vector_store = FAISS.from_documents(batch, embeddings)
-                else:
-                    vector_store.add_documents(batch)
-        else:
-            vector_store = FAISS.from_documents(splits, embeddings)
+        count = _add_to_knowledge_base(splits, embeddings, chat_id, source_name, source_type)
+        
+        logger.info(f"✅ Indexed {count} chunks")
+        return count
         
-        index_dir = "./faiss_index"
-        os.makedirs(index_dir, exist_ok=True)
+    except Exception as e:
+        logger.error(f"Indexing failed: {str(e)}")
+        raise RuntimeError(f"Indexing failed: {str(e)}")
+
+def reindex_pdf_stream(source: str, chat_id=None, source_name: str = None) -> int:
+    """Stream a PDF through splitting and embedding into the chat's namespace.
+    
+    Pages are parsed in a background thread while earlier batches are being
+    embedded; memory is bounded by the batch size, not the file size.
+    """
+    try:
+        _validate_file_source(source)
+        
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY not found in environment variables")
+        
+        embeddings = build_embeddings(api_key, chunk_size=100)
+        dispatcher = EmbeddingDispatcher(embeddings)
+        source_name = source_name or source
+        
+        logger.info(f"📥 Streaming PDF file: {source}")
         
-        logger.info("💾 Saving vector store...")
-        vector_store.save_local(index_dir)
+        # One deduplicator for the whole file, so repeats across batches are caught too
+        deduplicator = ChunkDeduplicator(threshold_for('file')) if DEDUP_ENABLED else None
         
-        logger.info(f"✅ Created vector store with {len(splits)} chunks")
-        return len(splits)
+        def embedded_batches():
+            batches = _prefetch(_batched(_iter_pdf_chunks(source), INGEST_BATCH_CHUNKS))
+            for number, splits in enumerate(batches, 1):
+                if deduplicator:
+                    splits = deduplicator.filter(splits)
+                    if not splits:
+                        continue
+                texts = [split.page_content for split in splits]
+                metadatas = [split.metadata for split in splits]
+                token_counts = [m.get("token_count") for m in metadatas]
+                logger.info(f"📊 Embedding batch {number} ({len(texts)} chunks)...")
+                yield texts, dispatcher.embed(texts, token_counts), metadatas
+        
+        count = registry.add_source_batches(
+            chat_id, document_id(source_name), source_name, 'file', embedded_batches(), embeddings
+        )
+        if deduplicator and deduplicator.removed:
+            logger.info(f"🧹 Removed {deduplicator.removed} of {deduplicator.seen} chunks as near-duplicates "
+                        f"(threshold {deduplicator.threshold})")
+        
+        logger.info(f"✅ Indexed {count} chunks")
+        return count
         
     except Exception as e:
         logger.error(f"Indexing failed: {str(e)}")
         raise RuntimeError(f"Indexing failed: {str(e)}")
 
-def get_index_info() -> dict:
-    """Get information about the current index."""
-    index_dir = "./faiss_index"
+def reindex(source: str, chat_id=None, source_name: str = None) -> int:
+    """Reindex content from URL or file into the chat's namespace."""
+    if is_pdf_source(source):
+        return reindex_pdf_stream(source, chat_id=chat_id, source_name=source_name)
+    splits = load_and_split(source)
+    return index_splits(splits, source, chat_id=chat_id, source_name=source_name)
+
+def get_index_info(chat_id=None, doc_id: str = None) -> dict:
+    """Get information about the chat's knowledge base (and one of its sources if doc_id is given)."""
+    index_dir = registry.resolve(chat_id)
     
-    if not os.path.exists(index_dir):
+    if not index_dir:
         return None
     
     try:
-        index_files = [f for f in os.listdir(index_dir) if f.endswith('.faiss') or f.endswith('.pkl')]
+        index_files = [f for f in os.listdir(index_dir) if f.endswith('.faiss')]
         if not index_files:
             return None
             
         total_size = sum(os.path.getsize(os.path.join(index_dir, f)) for f in os.listdir(index_dir))
+        sources = registry.list_sources(chat_id)
         
-        return {
+        info = {
             "exists": True,
             "file_count": len(index_files),
             "total_size": total_size,
-            "path": os.path.abspath(index_dir)
+            "path": os.path.abspath(index_dir),
+            "documents": len(sources),
+            "chunks": sum(entry["chunks"] for entry in sources.values())
         }
+        if doc_id:
+            entry = sources.get(doc_id)
+            if not entry:
+                return None
+            info["document"] = {k: v for k, v in entry.items() if k != "ids"}
+        return info
         
     except Exception as e:
         logger.error(f"Error getting index info: {str(e)}")
         return None
 
-def clear_index() -> bool:
-    """Clear the FAISS index."""
+def clear_index(chat_id=None, doc_id: str = None) -> bool:
+    """Remove one source from the chat's knowledge base, or the whole knowledge base when doc_id is None."""
     try:
-        index_dir = "./faiss_index"
-        if os.path.exists(index_dir):
-            for file in os.listdir(index_dir):
-                file_path = os.path.join(index_dir, file)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+        if doc_id:
+            removed = registry.remove_source(chat_id, doc_id, build_embeddings(os.getenv("OPENAI_API_KEY")))
+        else:
+            removed = registry.remove(chat_id)
+        if removed:
             logger.info("✅ Index cleared successfully")
-            return True
-        return False
+        return removed
     except Exception as e:
         logger.error(f"Error clearing index: {str(e)}")
         return False
@@ -0,0 +1,207 @@
+import os
+import json
+import mmap
+import shutil
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+# Knowledge base files:
+#   index.faiss           # vectors, memory-mapped by readers
+#   docstore.arena        # chunk texts and metadata, JSON records back to back
+#   docstore.offsets.npy  # (offset, length) of each record, row i = index position i
+#   docstore.ids.json     # docstore id of each index position
+INDEX_FILE = "index.faiss"
+ARENA_FILE = "docstore.arena"
+OFFSETS_FILE = "docstore.offsets.npy"
+IDS_FILE = "docstore.ids.json"
+
+# The arena is rewritten without dead records once they make up this share of it
+ARENA_COMPACT_RATIO = 0.5
+
+# Indexes are mapped read-only, their pages come from the OS page cache. Flat/HNSW codes
+# and IVF lists take different flags, and faiss rejects an IVF index read with both.
+_MMAP_CODES_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+_MMAP_LISTS_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+# Index files start with a fourcc; the IVF family's starts with "Iw"
+_IVF_FOURCC_PREFIX = b"Iw"
+
+
+def _encode(doc: Document) -> bytes:
+    return json.dumps(
+        {"text": doc.page_content, "metadata": doc.metadata},
+        ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class ArenaDocstore(Docstore, AddableMixin):
+    """
+    Docstore reading its records from a memory-mapped arena file on demand
+
+    Opening it only loads the id list; a record is decoded when a search hits
+    it. Documents added or deleted afterwards are kept in memory until the
+    knowledge base is saved again.
+    """
+
+    def __init__(self, folder_path: Optional[str] = None):
+        self.arena_path = None
+        self.ids = []
+        self._arena = b""
+        self._offsets = np.zeros((0, 2), dtype=np.int64)
+        self._rows = {}
+        self._added = {}
+        self._deleted = set()
+        if folder_path is not None:
+            self._open(folder_path)
+
+    def _open(self, folder_path: str):
+        self.arena_path = os.path.join(folder_path, ARENA_FILE)
+        with open(os.path.join(folder_path, IDS_FILE), encoding="utf-8") as f:
+            self.ids = json.load(f)
+        if not self.ids:
+            return
+        self._offsets = np.load(os.path.join(folder_path, OFFSETS_FILE), mmap_mode="r")
+        with open(self.arena_path, "rb") as f:
+            self._arena = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+    @property
+    def arena_size(self) -> int:
+        return len(self._arena)
+
+    def location(self, doc_id: str) -> Optional[Tuple[int, int]]:
+        """(offset, length) of the record if it is still the one stored in the arena"""
+        if doc_id in self._added or doc_id in self._deleted:
+            return None
+        row = self._rows.get(doc_id)
+        if row is None:
+            return None
+        offset, length = self._offsets[row]
+        return int(offset), int(length)
+
+    def raw(self, offset: int, length: int) -> bytes:
+        return self._arena[offset:offset + length]
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self._added.get(search)
+        if doc is not None:
+            return doc
+        location = self.location(search)
+        if location is None:
+            return f"ID {search} not found."
+        data = json.loads(self.raw(*location))
+        return Document(id=search, page_content=data["text"], metadata=data["metadata"])
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [
+            doc_id for doc_id in texts
+            if doc_id in self._added or (doc_id in self._rows and doc_id not in self._deleted)
+        ]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        for doc_id in ids:
+            self._added.pop(doc_id, None)
+            if doc_id in self._rows:
+                self._deleted.add(doc_id)
+
+
+def _link_or_copy(source: str, target: str):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def save_store(vector_store: FAISS, folder_path: str):
+    """
+    Write a knowledge base in the arena format
+
+    If the store was opened from an arena, that file is hard-linked into the
+    new folder and only new records are appended: versions still open in
+    other processes keep reading their own records, which never move. Once
+    dead records make up ARENA_COMPACT_RATIO of it the arena is rewritten.
+    Callers hold the knowledge base's write lock (see IndexRegistry), as
+    concurrent appends to the shared arena would record wrong offsets.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    arena_path = os.path.join(folder_path, ARENA_FILE)
+    if os.path.exists(arena_path):
+        # Leftover of an interrupted save; it may be a link to a live arena
+        os.remove(arena_path)
+    faiss.write_index(vector_store.index, os.path.join(folder_path, INDEX_FILE))
+
+    mapping = vector_store.index_to_docstore_id
+    ids = [mapping[position] for position in sorted(mapping)]
+    docstore = vector_store.docstore
+    base = docstore if isinstance(docstore, ArenaDocstore) and docstore.arena_path else None
+    locations = [base.location(doc_id) if base else None for doc_id in ids]
+
+    append = False
+    if base is not None:
+        live = sum(location[1] for location in locations if location)
+        append = base.arena_size - live <= ARENA_COMPACT_RATIO * base.arena_size
+        if not append:
+            logger.info(f"Compacting docstore arena ({live} of {base.arena_size} bytes live)")
+
+    offsets = np.zeros((len(ids), 2), dtype=np.int64)
+    if append:
+        _link_or_copy(base.arena_path, arena_path)
+    with open(arena_path, "ab" if append else "wb") as f:
+        position = f.seek(0, os.SEEK_END)
+        for row, (doc_id, location) in enumerate(zip(ids, locations)):
+            if append and location is not None:
+                offsets[row] = location
+                continue
+            if location is not None:
+                data = base.raw(*location)
+            else:
+                doc = docstore.search(doc_id)
+                if not isinstance(doc, Document):
+                    raise ValueError(f"Document {doc_id} is missing from the docstore")
+                data = _encode(doc)
+            f.write(data)
+            offsets[row] = (position, len(data))
+            position += len(data)
+
+    np.save(os.path.join(folder_path, OFFSETS_FILE), offsets)
+    with open(os.path.join(folder_path, IDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(ids, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def _read_index_mmap(index_path: str) -> faiss.Index:
+    with open(index_path, "rb") as f:
+        fourcc = f.read(4)
+    flags = _MMAP_LISTS_FLAGS if fourcc.startswith(_IVF_FOURCC_PREFIX) else _MMAP_CODES_FLAGS
+    try:
+        return faiss.read_index(index_path, flags)
+    except RuntimeError as e:
+        # An index type this faiss build cannot map: read it into memory instead
+        logger.warning(f"Memory-mapping {index_path} failed, reading it instead: {str(e).splitlines()[0]}")
+        return faiss.read_index(index_path)
+
+
+def load_store(folder_path: str, embeddings, writable: bool = False) -> FAISS:
+    """
+    Open a knowledge base
+
+    Readers memory-map the index read-only, so opening is near-instant and
+    processes share its pages; writers read it into memory to add or remove
+    vectors. Only the arena format is read: folders without its files (such
+    as pickled FAISS.save_local stores) are rejected, never unpickled.
+    """
+    if not os.path.exists(os.path.join(folder_path, IDS_FILE)):
+        raise ValueError(f"Unsupported knowledge base (no {IDS_FILE}): {folder_path}")
+    index_path = os.path.join(folder_path, INDEX_FILE)
+    index = faiss.read_index(index_path) if writable else _read_index_mmap(index_path)
+    docstore = ArenaDocstore(folder_path)
+    return FAISS(embeddings, index, docstore, dict(enumerate(docstore.ids)))
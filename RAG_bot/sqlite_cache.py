@@ -0,0 +1,67 @@
+import time
+import sqlite3
+import logging
+import threading
+from typing import Callable, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SqliteLRUCache:
+    """
+    Base of the on-disk caches: one SQLite table evicted least-recently-used past a size limit
+
+    Subclasses set TABLE and KEY (its primary key column) and pass the table
+    schema, which needs integer size and real last_access columns. The
+    connection is shared by threads behind self._lock; WAL lets several bot
+    processes read while one writes.
+    """
+
+    TABLE = None
+    KEY = None
+
+    def __init__(self, path: str, max_bytes: int, schema: str):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(schema)
+        self._conn.commit()
+
+    def _touch(self, key: str):
+        """Mark an entry as used; call with self._lock held"""
+        self._conn.execute(f"UPDATE {self.TABLE} SET last_access = ? WHERE {self.KEY} = ?", (time.time(), key))
+        self._conn.commit()
+
+    def _evict(self) -> List[str]:
+        """Drop the least recently used entries past max_bytes; call with self._lock held after a write"""
+        total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.TABLE}").fetchone()[0]
+        if total <= self.max_bytes:
+            return []
+        rows = self._conn.execute(f"SELECT {self.KEY}, size FROM {self.TABLE} ORDER BY last_access").fetchall()
+        evicted = []
+        # Never evict the entry just written (it is the most recent one)
+        for key, size in rows[:-1]:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(f"DELETE FROM {self.TABLE} WHERE {self.KEY} = ?", (key,))
+            total -= size
+            evicted.append(key)
+        return evicted
+
+
+def process_wide(factory: Callable[[], T]) -> Callable[[], T]:
+    """Getter of one instance per process, created by factory on first use"""
+    instance = None
+    lock = threading.Lock()
+
+    def get() -> T:
+        nonlocal instance
+        with lock:
+            if instance is None:
+                instance = factory()
+            return instance
+
+    return get
@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from langchain_core.documents import Document
+
+from embedding_cache import text_hash
+from sqlite_cache import SqliteLRUCache, process_wide
+from tokenizer_service import tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Chunk tokens per map call, and notes per reduce call
+SUMMARY_BATCH_TOKENS = int(os.getenv("SUMMARY_BATCH_TOKENS", "6000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "./summary_cache.db")
+SUMMARY_CACHE_MAX_MB = int(os.getenv("SUMMARY_CACHE_MAX_MB", "50"))
+# Bump when MAP_PROMPT or COMBINE_PROMPT change so cached notes are not reused
+SUMMARY_PROMPT_VERSION = "1"
+
+# Notes stay in the document's language, so they are shared by summaries in every language
+MAP_PROMPT = """Extract the key points of this part of a document as short notes:
+arguments, findings, figures, names and practical advice. Keep concrete details,
+add nothing that is not in the text and write in the text's own language.
+
+Text:
+{text}"""
+
+COMBINE_PROMPT = """Merge these notes from consecutive parts of one document into a single set
+of notes. Keep the arguments, findings and concrete details, drop repetitions and
+write in the notes' own language.
+
+Notes:
+{text}"""
+
+
+def _key(stage: str, model: str, hashes: List[str]) -> str:
+    return hashlib.sha256(f"{SUMMARY_PROMPT_VERSION}|{model}|{stage}|{','.join(hashes)}".encode("utf-8")).hexdigest()
+
+
+def _pack(items: list, counts: List[int], budget: int, min_size: int = 1) -> List[list]:
+    """Consecutive groups of items of up to budget tokens, at least min_size items each"""
+    groups, current, total = [], [], 0
+    for item, count in zip(items, counts):
+        if current and total + count > budget and len(current) >= min_size:
+            groups.append(current)
+            current, total = [], 0
+        current.append(item)
+        total += count
+    if current:
+        groups.append(current)
+    return groups
+
+
+class SummaryCache(SqliteLRUCache):
+    """Persistent partial summaries keyed by the hashes of the text they summarize, evicted LRU"""
+
+    TABLE = "summaries"
+    KEY = "key"
+
+    def __init__(self, path: str = SUMMARY_CACHE_PATH, max_bytes: int = SUMMARY_CACHE_MAX_MB * 1024 * 1024):
+        super().__init__(path, max_bytes, '''
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touch(key)
+        return row[0]
+
+    def put(self, key: str, summary: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, summary, len(summary.encode("utf-8")), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+
+_cache = process_wide(SummaryCache)
+
+
+def get_summary_cache() -> SummaryCache:
+    """Process-wide summary cache (opened on first use)"""
+    return _cache()
+
+
+class Summarizer:
+    """
+    Map-reduce summaries of a whole knowledge base
+
+    Chunks are packed into token-budgeted batches per source and turned into
+    notes by concurrent LLM calls; the notes are merged level by level until
+    they fit one call, which writes the summary with the caller's prompt.
+    Every step is cached by the hashes of its input, so a re-run or a summary
+    in another language only pays for the final call.
+    """
+
+    def __init__(self, llm, model: str, cache: Optional[SummaryCache] = None,
+                 batch_tokens: int = SUMMARY_BATCH_TOKENS, concurrency: int = SUMMARY_CONCURRENCY):
+        self.llm = llm
+        self.model = model
+        self._cache = cache
+        self.batch_tokens = batch_tokens
+        self.concurrency = concurrency
+        self.stats = {"cached": 0, "generated": 0}
+
+    @property
+    def cache(self) -> SummaryCache:
+        if self._cache is None:
+            self._cache = get_summary_cache()
+        return self._cache
+
+    def _map_batches(self, docs: List[Document]) -> List[List[str]]:
+        # Batches never span sources, so adding a source leaves the others' batches (and cache keys) alone
+        by_source = {}
+        for doc in docs:
+            by_source.setdefault(doc.metadata.get("source_id"), []).append(doc)
+        batches = []
+        for source_docs in by_source.values():
+            counts = [doc.metadata.get("token_count") or tokenizer.count(doc.page_content) for doc in source_docs]
+            texts = [doc.page_content for doc in source_docs]
+            batches.extend(_pack(texts, counts, self.batch_tokens))
+        return batches
+
+    async def _generate(self, run_io: Callable[..., Awaitable], semaphore: asyncio.Semaphore,
+                        stage: str, template: str, parts: List[str]) -> str:
+        key = _key(stage, self.model, [text_hash(part) for part in parts])
+        # SQLite calls block, keep them off the event loop
+        cached = await run_io(self.cache.get, key)
+        if cached is not None:
+            self.stats["cached"] += 1
+            return cached
+        prompt = template.replace("{text}", "\n\n".join(parts))
+        async with semaphore:
+            response = await self.llm.ainvoke(prompt)
+        self.stats["generated"] += 1
+        await run_io(self.cache.put, key, response.content)
+        return response.content
+
+    async def _reduce(self, run_io: Callable[..., Awaitable], semaphore: asyncio.Semaphore,
+                      notes: List[str]) -> List[str]:
+        """Merge notes until they fit one batch; every level at least halves their number"""
+        level = 0
+        counts = await run_io(tokenizer.count_batch, notes)
+        while len(notes) > 1 and sum(counts) > self.batch_tokens:
+            level += 1
+            groups = _pack(notes, counts, self.batch_tokens, min_size=2)
+            logger.info(f"Summary reduce level {level}: {len(notes)} notes in {len(groups)} groups")
+            notes = list(await asyncio.gather(*[
+                self._generate(run_io, semaphore, "combine", COMBINE_PROMPT, group) if len(group) > 1
+                else asyncio.sleep(0, result=group[0])
+                for group in groups
+            ]))
+            counts = await run_io(tokenizer.count_batch, notes)
+        return notes
+
+    async def asummarize(self, docs: List[Document], prompt: str,
+                         run_io: Callable[..., Awaitable] = asyncio.to_thread) -> str:
+        """
+        Summarize docs (in document order) with prompt, whose {text} receives the merged notes
+
+        Token counting and cache reads/writes go through run_io (the
+        pipeline's thread pool), only the LLM calls run on the event loop.
+
+        Returns:
+            The summary text, empty if there is nothing to summarize
+        """
+        if not docs:
+            return ""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = await run_io(self._map_batches, docs)
+        logger.info(f"📝 Summarizing {len(docs)} chunks in {len(batches)} batches")
+        notes = await asyncio.gather(*[
+            self._generate(run_io, semaphore, "map", MAP_PROMPT, batch) for batch in batches
+        ])
+        notes = await self._reduce(run_io, semaphore, list(notes))
+        # The prompt itself is part of the key: each language gets its own final summary
+        summary = await self._generate(run_io, semaphore, f"final:{text_hash(prompt)}", prompt, notes)
+        logger.info(f"Summary done: {self.stats['generated']} LLM calls so far, {self.stats['cached']} cache hits")
+        return summary
@@ -0,0 +1,52 @@
+import os
+import logging
+import threading
+from typing import List
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_MODEL = "text-embedding-3-small"
+# Threads used by tiktoken for batched encoding
+TOKENIZER_THREADS = int(os.getenv("TOKENIZER_THREADS", "4"))
+
+
+class TokenizerService:
+    """Token counting with one cached tiktoken encoder per model"""
+
+    def __init__(self, num_threads: int = TOKENIZER_THREADS):
+        self.num_threads = num_threads
+        self._encoders = {}
+        self._lock = threading.Lock()
+
+    def encoder(self, model: str = TOKENIZER_MODEL):
+        """Encoder for the model, or None if tiktoken cannot provide one (offline, unknown model)"""
+        with self._lock:
+            if model not in self._encoders:
+                try:
+                    self._encoders[model] = tiktoken.encoding_for_model(model)
+                except Exception as e:
+                    logger.warning(f"No tiktoken encoder for {model}, estimating tokens: {str(e)}")
+                    self._encoders[model] = None
+            return self._encoders[model]
+
+    def count(self, text: str, model: str = TOKENIZER_MODEL) -> int:
+        encoding = self.encoder(model)
+        if encoding is None:
+            return len(text) // 4
+        # Text is data here, special-token markers are counted like any other text
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count_batch(self, texts: List[str], model: str = TOKENIZER_MODEL) -> List[int]:
+        """Token counts of many texts in one encode_batch call"""
+        if not texts:
+            return []
+        encoding = self.encoder(model)
+        if encoding is None:
+            return [len(text) // 4 for text in texts]
+        encoded = encoding.encode_batch(texts, num_threads=self.num_threads, disallowed_special=())
+        return [len(tokens) for tokens in encoded]
+
+
+tokenizer = TokenizerService()
@@ -0,0 +1,113 @@
+import os
+import re
+import time
+import logging
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from sqlite_cache import SqliteLRUCache, process_wide
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "./transcript_cache.db")
+TRANSCRIPT_CACHE_MAX_MB = int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "200"))
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com",
+                  "youtube-nocookie.com", "www.youtube-nocookie.com")
+_SHORT_HOSTS = ("youtu.be", "www.youtu.be")
+_PATH_PREFIXES = ("shorts", "embed", "live", "v", "e")
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Canonical 11-character video id from any youtube.com / youtu.be / m.youtube.com URL form"""
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return None
+    host = (parsed.hostname or "").lower()
+    parts = [p for p in parsed.path.split("/") if p]
+
+    candidate = None
+    if host in _SHORT_HOSTS:
+        candidate = parts[0] if parts else None
+    elif host in _YOUTUBE_HOSTS:
+        if parts and parts[0] == "watch":
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(parts) >= 2 and parts[0] in _PATH_PREFIXES:
+            candidate = parts[1]
+        elif not parts or parts[0] == "attribution_link":
+            # /attribution_link?u=/watch%3Fv%3D... and bare ?v= links
+            query = parse_qs(parsed.query)
+            candidate = query.get("v", [None])[0]
+            if not candidate and query.get("u"):
+                return extract_video_id("https://www.youtube.com" + query["u"][0])
+
+    if candidate and _VIDEO_ID.match(candidate):
+        return candidate
+    return None
+
+
+class TranscriptCache(SqliteLRUCache):
+    """Persistent transcripts keyed by video id, evicted least-recently-used past a size limit"""
+
+    TABLE = "transcripts"
+    KEY = "video_id"
+
+    def __init__(self, path: str = TRANSCRIPT_CACHE_PATH, max_bytes: int = TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024):
+        super().__init__(path, max_bytes, '''
+            CREATE TABLE IF NOT EXISTS transcripts (
+                video_id TEXT PRIMARY KEY,
+                title TEXT,
+                transcript TEXT NOT NULL,
+                language TEXT,
+                duration INTEGER,
+                model TEXT,
+                video_info TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+
+    def get(self, video_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, transcript, language, duration, model, video_info "
+                "FROM transcripts WHERE video_id = ?",
+                (video_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(video_id)
+        logger.info(f"Transcript cache hit for video {video_id}")
+        keys = ("title", "transcript", "language", "duration", "model", "video_info")
+        return dict(zip(keys, row))
+
+    def get_by_url(self, url: str) -> Optional[dict]:
+        video_id = extract_video_id(url)
+        return self.get(video_id) if video_id else None
+
+    def put(self, video_id: str, title: str, transcript: str, language: Optional[str] = None,
+            duration: Optional[int] = None, model: Optional[str] = None, video_info: Optional[str] = None):
+        size = len(transcript.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(video_id, title, transcript, language, duration, model, video_info, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, title, transcript, language, duration, model, video_info, size, now, now)
+            )
+            evicted = self._evict()
+            self._conn.commit()
+        for evicted_id in evicted:
+            logger.info(f"Evicted cached transcript of video {evicted_id}")
+
+
+_cache = process_wide(TranscriptCache)
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """Process-wide transcript cache (opened on first use)"""
+    return _cache()
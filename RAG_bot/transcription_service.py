@@ -0,0 +1,265 @@
+import os
+import re
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Model size per deployment: tiny / base / small
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")
+# Worker processes, each keeps its own copy of the model in memory. Segmented parallel
+# transcription needs at least 2; the default uses half the cores, between 2 and 4.
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", str(min(4, max(2, (os.cpu_count() or 2) // 2)))))
+
+# Segmented mode for long audio: window length, overlap between windows and
+# the part at the end of each window searched for a quiet cut point (seconds)
+SEGMENT_SECONDS = float(os.getenv("WHISPER_SEGMENT_SECONDS", "300"))
+SEGMENT_OVERLAP = float(os.getenv("WHISPER_SEGMENT_OVERLAP", "1.0"))
+SEGMENT_SEARCH = 30.0
+SAMPLE_RATE = 16000
+
+# Model of the current worker process
+_worker_model = None
+
+
+def _load_model(model_size: str):
+    """Load Whisper model for transcription"""
+    import whisper
+    try:
+        logger.info(f"Loading Whisper model '{model_size}'...")
+        model = whisper.load_model(model_size)
+        logger.info("Whisper model loaded successfully")
+        return model
+    except Exception as e:
+        logger.error(f"Failed to load Whisper model: {str(e)}")
+        logger.error(f"Error type: {type(e).__name__}")
+        # Try alternative loading method
+        try:
+            logger.info("Trying alternative Whisper loading...")
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            logger.info(f"Using {device.upper()}")
+            model = whisper.load_model(model_size, device=device)
+            logger.info("Whisper model loaded successfully with alternative method")
+            return model
+        except Exception as e2:
+            logger.error(f"Alternative loading also failed: {str(e2)}")
+            return None
+
+
+def _init_worker(model_size: str, workers: int = 1):
+    global _worker_model
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    try:
+        # Share the cores between workers instead of every worker using all of them
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+    except Exception:
+        pass
+    _worker_model = _load_model(model_size)
+
+
+def _warm_up() -> bool:
+    return _worker_model is not None
+
+
+def _transcribe(audio, language: Optional[str] = None) -> dict:
+    """Run in a worker: audio is a file path or a 16 kHz float32 sample array"""
+    if _worker_model is None:
+        raise RuntimeError("Whisper model not loaded")
+    result = _worker_model.transcribe(
+        audio,
+        verbose=False,
+        language=language,  # None = auto-detect
+        fp16=False  # Disable fp16 for better compatibility
+    )
+    return {"text": result["text"].strip(), "language": result.get("language")}
+
+
+def _detect_language(samples) -> Optional[str]:
+    """Run in a worker: detect the spoken language from the first 30 seconds"""
+    import whisper
+    if _worker_model is None:
+        raise RuntimeError("Whisper model not loaded")
+    audio = whisper.pad_or_trim(samples)
+    n_mels = getattr(_worker_model.dims, "n_mels", 80)
+    try:
+        mel = whisper.log_mel_spectrogram(audio, n_mels)
+    except TypeError:
+        # Older releases only support 80 mel bins
+        mel = whisper.log_mel_spectrogram(audio)
+    _, probs = _worker_model.detect_language(mel.to(_worker_model.device))
+    return max(probs, key=probs.get)
+
+
+def split_on_silence(samples: np.ndarray, sample_rate: int = SAMPLE_RATE,
+                     max_seconds: float = SEGMENT_SECONDS, search_seconds: float = SEGMENT_SEARCH,
+                     frame_seconds: float = 0.1) -> List[Tuple[int, int]]:
+    """
+    Split audio into windows of at most max_seconds
+
+    Each window ends at the quietest frame (lowest RMS energy) found in its
+    last search_seconds, so cuts fall into pauses rather than mid-word.
+    Returns (start, end) sample offsets.
+    """
+    frame = int(frame_seconds * sample_rate)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return [(0, len(samples))]
+    energy = np.sqrt(np.mean(samples[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+    max_frames = int(max_seconds / frame_seconds)
+    search_frames = min(int(search_seconds / frame_seconds), max_frames // 2)
+    bounds = []
+    start = 0
+    while n_frames - start > max_frames:
+        window_end = start + max_frames
+        cut = window_end - search_frames + int(np.argmin(energy[window_end - search_frames:window_end]))
+        bounds.append((start * frame, cut * frame))
+        start = cut
+    bounds.append((start * frame, len(samples)))
+    return bounds
+
+
+def audio_duration(path: str) -> Optional[float]:
+    """Duration of an audio file in seconds from its container header (ffprobe), None if unknown"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", path],
+            capture_output=True, text=True, timeout=30
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def _words(text: str) -> List[str]:
+    return [re.sub(r"[^\w]", "", w).lower() for w in text.split()]
+
+
+def stitch_transcripts(texts: List[str], max_overlap_words: int = 20) -> str:
+    """Join window transcripts, dropping words repeated because of the window overlap"""
+    result = []
+    for text in texts:
+        words = text.split()
+        if result and words:
+            tail, head = _words(" ".join(result[-max_overlap_words:])), _words(" ".join(words[:max_overlap_words]))
+            for k in range(min(len(tail), len(head)), 0, -1):
+                if tail[-k:] == head[:k]:
+                    words = words[k:]
+                    break
+        result.extend(words)
+    return " ".join(result)
+
+
+class TranscriptionService:
+    """Pool of warm Whisper worker processes shared by all requests"""
+
+    def __init__(self, model_size: str = WHISPER_MODEL, workers: int = WHISPER_WORKERS):
+        self.model_size = model_size
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def start(self, background: bool = True):
+        """Start the workers and load the model in each of them"""
+        with self._lock:
+            if self._pool is not None:
+                return
+            logger.info(f"Starting {self.workers} Whisper worker(s) with model '{self.model_size}'")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_size, self.workers)
+            )
+            # One task per worker forces every process (and its model) to start now
+            warm_ups = [self._pool.submit(_warm_up) for _ in range(self.workers)]
+        if not background:
+            if not all(f.result() for f in warm_ups):
+                logger.error("Some Whisper workers failed to load the model")
+
+    def submit(self, audio, language: Optional[str] = None) -> Future:
+        """Queue a transcription; the result is {"text", "language"}"""
+        self.start()
+        with self._lock:
+            self._pending += 1
+            future = self._pool.submit(_transcribe, audio, language)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def transcribe(self, audio, language: Optional[str] = None) -> dict:
+        return self.submit(audio, language).result()
+
+    def transcribe_segmented(self, audio, language: Optional[str] = None,
+                             window_seconds: float = SEGMENT_SECONDS,
+                             overlap_seconds: float = SEGMENT_OVERLAP) -> dict:
+        """
+        Transcribe long audio in parallel windows split at quiet points
+
+        Short audio, or a service with a single worker, falls back to one
+        plain transcription call. A file is only decoded here when it is
+        split; otherwise the worker reads it itself.
+        """
+        if isinstance(audio, str):
+            if self.workers < 2:
+                return self.transcribe(audio, language)
+            duration = audio_duration(audio)
+            if duration is not None and duration <= 2 * window_seconds:
+                return self.transcribe(audio, language)
+            import whisper
+            samples = whisper.load_audio(audio)
+        else:
+            samples = np.asarray(audio, dtype=np.float32)
+
+        duration = len(samples) / SAMPLE_RATE
+        if self.workers < 2 or duration <= 2 * window_seconds:
+            return self.transcribe(samples, language)
+
+        bounds = split_on_silence(samples, max_seconds=window_seconds)
+        logger.info(f"Transcribing {duration / 60:.0f} min of audio in {len(bounds)} segments "
+                    f"across {self.workers} workers")
+
+        # Detect once so every window is transcribed in the same language
+        self.start()
+        if language is None:
+            language = self._pool.submit(_detect_language, samples[:30 * SAMPLE_RATE]).result()
+            logger.info(f"Detected language: {language}")
+
+        overlap = int(overlap_seconds * SAMPLE_RATE)
+        futures = [
+            self.submit(samples[max(0, start - overlap):end], language)
+            for start, end in bounds
+        ]
+        texts = [f.result()["text"] for f in futures]
+        return {"text": stitch_transcripts(texts).strip(), "language": language}
+
+    def queue_depth(self) -> dict:
+        with self._lock:
+            running = min(self._pending, self.workers)
+            return {"queued": self._pending - running, "running": running, "workers": self.workers}
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._pool is not None:
+                logger.info("Shutting down Whisper workers...")
+                self._pool.shutdown(wait=wait, cancel_futures=not wait)
+                self._pool = None
+
+
+transcription_service = TranscriptionService()
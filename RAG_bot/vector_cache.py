@@ -0,0 +1,158 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bounds for the in-memory cache of loaded FAISS stores
+MAX_ENTRIES = int(os.getenv("VECTOR_CACHE_MAX_ENTRIES", "16"))
+MAX_BYTES = int(os.getenv("VECTOR_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Rewritten on every save (see kb_store); the arena itself is only appended to
+INDEX_FILES = ("index.faiss", "docstore.ids.json")
+
+
+def _stamp(folder_path: str, files: Tuple[str, ...]) -> Optional[Tuple[int, ...]]:
+    stamp = []
+    for name in files:
+        try:
+            st = os.stat(os.path.join(folder_path, name))
+        except OSError:
+            return None
+        stamp.extend((st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def index_version(folder_path: str) -> Optional[Tuple[int, ...]]:
+    """Return a version stamp (mtime/size of the index files) or None if the index is missing."""
+    return _stamp(folder_path, INDEX_FILES)
+
+
+def _index_bytes(folder_path: str, files: Tuple[str, ...] = INDEX_FILES) -> int:
+    """Approximate in-memory size of a store by the size of its files on disk."""
+    total = 0
+    for name in files:
+        try:
+            total += os.path.getsize(os.path.join(folder_path, name))
+        except OSError:
+            pass
+    return total
+
+
+class VectorStoreCache:
+    """
+    Process-wide LRU cache of loaded vector stores keyed by index path and version
+
+    Structures derived from the same index (kind="bm25") are cached under the
+    same path and version and invalidated together with it.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (path, kind) -> (version, store, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, folder_path: str, loader: Callable[[str], object], kind: str = "faiss",
+            files: Tuple[str, ...] = INDEX_FILES):
+        """
+        Return the store for folder_path, loading it with loader() on a miss
+
+        The on-disk version is re-checked on every call, so an index rewritten
+        by another process is picked up even without an explicit invalidation.
+        files are the ones the loaded object is sized by.
+        """
+        path = os.path.abspath(folder_path)
+        version = index_version(path)
+        if version is None:
+            self.invalidate(path)
+            return None
+        key = (path, kind)
+
+        cached = self._lookup(key, version)
+        if cached is not None:
+            return cached
+
+        # One loader per path, so concurrent questions don't all hit the disk
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            cached = self._lookup(key, version)
+            if cached is not None:
+                return cached
+
+            with self._lock:
+                self.stats["misses"] += 1
+            logger.info(f"Vector cache miss, loading {kind} index from disk: {path}")
+            store = loader(path)
+            if store is not None:
+                self._put(key, version, store, _index_bytes(path, files))
+            return store
+
+    def _lookup(self, key: tuple, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def _put(self, key: tuple, version, store, nbytes: int):
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (version, store, nbytes)
+            self._total_bytes += nbytes
+            # Always keep the entry just loaded, even if it alone exceeds the byte budget
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+            ):
+                old_key, _ = next(iter(self._entries.items()))
+                self._drop(old_key)
+                self.stats["evictions"] += 1
+                logger.info(f"Evicted vector store from cache: {old_key}")
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def invalidate(self, folder_path: str):
+        """Forget everything cached for folder_path (called after the index is rewritten)"""
+        path = os.path.abspath(folder_path)
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == path]
+            for key in keys:
+                self._drop(key)
+            if keys:
+                self.stats["invalidations"] += 1
+                logger.info(f"Invalidated cached vector store: {path}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                **self.stats
+            }
+
+
+vector_cache = VectorStoreCache()
+
+
+def invalidate_index(folder_path: str):
+    """Invalidation hook for the registry after a knowledge base is saved"""
+    vector_cache.invalidate(folder_path)
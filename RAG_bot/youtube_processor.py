@@ -1,46 +1,291 @@
 import os
+import select
 import logging
 import tempfile
+import threading
 import subprocess
+from collections import Counter
 from typing import Optional, Tuple
 import yt_dlp
-import whisper
+import numpy as np
 from pathlib import Path
 
+from transcription_service import SAMPLE_RATE, transcription_service
+from transcript_cache import get_transcript_cache, extract_video_id
+from captions import choose_track, parse_captions, segments_to_text, MIN_CAPTION_CHARS
+
 logger = logging.getLogger(__name__)
 
+# A stalled audio stream is abandoned after this many seconds without data (like yt-dlp's socket_timeout)
+STREAM_READ_TIMEOUT = 20
+# Bytes read from ffmpeg's pipe at a time (~2 s of 16 kHz int16 audio)
+PCM_CHUNK_BYTES = 64 * 1024
+
+
+def read_pcm(cmd: list, expected_samples: int = 0, read_timeout: float = STREAM_READ_TIMEOUT) -> np.ndarray:
+    """
+    Run a decoder writing 16-bit mono PCM to stdout and collect it as float32 samples
+
+    The output is converted chunk by chunk into one buffer sized for
+    expected_samples (grown if the stream is longer), so the int16 audio is
+    never held in full. A read that waits longer than read_timeout kills the
+    decoder.
+    """
+    samples = np.empty(max(expected_samples, SAMPLE_RATE), dtype=np.float32)
+    count = 0
+    leftover = b""
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        fd = process.stdout.fileno()
+        while True:
+            # select() only waits on pipes on POSIX; elsewhere ffmpeg's -rw_timeout still applies
+            if os.name != "nt" and not select.select([fd], [], [], read_timeout)[0]:
+                raise RuntimeError(f"Audio stream stalled for {read_timeout:.0f}s")
+            chunk = os.read(fd, PCM_CHUNK_BYTES)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            usable = len(chunk) - len(chunk) % 2
+            leftover = chunk[usable:]
+            pcm = np.frombuffer(chunk, np.int16, usable // 2)
+            if count + pcm.size > samples.size:
+                grown = np.empty(max(samples.size * 2, count + pcm.size), dtype=np.float32)
+                grown[:count] = samples[:count]
+                samples = grown
+            # Same normalization as whisper.load_audio()
+            np.divide(pcm, 32768.0, out=samples[count:count + pcm.size])
+            count += pcm.size
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"FFmpeg decoding failed: {stderr.decode(errors='ignore')[-500:]}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+    return samples[:count]
+
+# Which path produced each transcript: cache / captions / whisper
+_source_counts = Counter()
+_source_lock = threading.Lock()
+
+def record_transcript_source(source: str):
+    with _source_lock:
+        _source_counts[source] += 1
+    logger.info(f"Transcript source: {source}")
+
+def get_transcript_source_stats() -> dict:
+    with _source_lock:
+        return dict(_source_counts)
+
 class YouTubeProcessor:
     """Handles YouTube video downloading and transcription"""
     
     def __init__(self):
-        self.temp_dir = tempfile.mkdtemp(prefix="youtube_")
-        self.whisper_model = None
-        self._load_whisper_model()
+        # The Whisper model lives in the shared transcription service
+        self._temp_dir = None
+        # Details of the last processed video, stored with cached transcripts
+        self.duration = None
+        self.language = None
+        self.source = None  # "captions" or "whisper"
+    
+    @property
+    def temp_dir(self) -> str:
+        """Per-request download directory, only created by the file download fallback"""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="youtube_")
+        return self._temp_dir
+    
+    def _ydl_options(self) -> dict:
+        """yt-dlp options shared by the streaming and the file download paths"""
+        # Optional runtime configs from environment
+        yt_proxy = os.getenv('YT_PROXY') or os.getenv('HTTP_PROXY') or os.getenv('HTTPS_PROXY')
+        yt_geo = os.getenv('YT_GEO', 'US')
+        yt_cookies_browser = os.getenv('YT_COOKIES_FROM_BROWSER')  # e.g., 'chrome' | 'edge' | 'firefox'
+        yt_cookies_file = os.getenv('YT_COOKIES_FILE')  # path to Netscape cookies.txt
+
+        # Configure yt-dlp options with robust network settings and anti-403 measures
+        ydl_opts = {
+            # Prefer m4a when available, then bestaudio, then best
+            'format': 'bestaudio[ext=m4a]/bestaudio/best',
+            # Let yt-dlp extract audio via FFmpeg postprocessor
+            'postprocessors': [
+                {
+                    'key': 'FFmpegExtractAudio',
+                    'preferredcodec': 'wav',
+                    'preferredquality': '192'
+                }
+            ],
+            'prefer_ffmpeg': True,
+            'keepvideo': False,
+            'noplaylist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'socket_timeout': 20,
+            'retries': 5,
+            'fragment_retries': 5,
+            'extractor_retries': 3,
+            'concurrent_fragment_downloads': 1,
+            'geo_bypass': True,
+            'geo_bypass_country': yt_geo,
+            'proxy': yt_proxy,
+            'retry_sleep_functions': {
+                'http': lambda _: 2,
+                'fragment': lambda _: 2
+            },
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
+            },
+            'extractor_args': {
+                'youtube': {
+                    'player_client': ['web']
+                }
+            },
+            'nocheckcertificate': True,
+        }
+
+        # Attach cookies if provided
+        if yt_cookies_browser:
+            ydl_opts['cookiesfrombrowser'] = (yt_cookies_browser,)
+        elif yt_cookies_file and os.path.exists(yt_cookies_file):
+            ydl_opts['cookiefile'] = yt_cookies_file
+        return ydl_opts
+    
+    def _stream_options(self) -> dict:
+        ydl_opts = self._ydl_options()
+        ydl_opts.pop('postprocessors', None)
+        ydl_opts['format'] = 'bestaudio/best'
+        return ydl_opts
+    
+    def extract_info(self, url: str) -> dict:
+        """Video metadata, caption tracks and the resolved bestaudio stream URL"""
+        if not self._is_youtube_url(url):
+            raise ValueError("Invalid YouTube URL")
+        with yt_dlp.YoutubeDL(self._stream_options()) as ydl:
+            return ydl.extract_info(url, download=False)
     
-    def _load_whisper_model(self):
-        """Load Whisper model for transcription"""
+    def fetch_captions(self, info: dict, language: Optional[str] = None) -> Optional[str]:
+        """
+        Transcript from uploaded or auto-generated captions, if the video has usable ones
+        
+        Returns:
+            Timestamped transcript text or None
+        """
         try:
-            logger.info("Loading Whisper model...")
-            # Try to load the smallest model first for better compatibility
-            self.whisper_model = whisper.load_model("tiny")
-            logger.info("Whisper model loaded successfully")
+            track = choose_track(info, language)
+            if not track:
+                logger.info("No usable caption tracks, Whisper will be used")
+                return None
+            
+            code, track_format, automatic = track
+            kind = "auto-generated" if automatic else "uploaded"
+            logger.info(f"Fetching {kind} captions ({code}, {track_format['ext']})")
+            
+            with yt_dlp.YoutubeDL(self._stream_options()) as ydl:
+                content = ydl.urlopen(track_format['url']).read().decode('utf-8', errors='ignore')
+            
+            segments = parse_captions(content, track_format['ext'])
+            transcript = segments_to_text(segments)
+            if len(transcript) < MIN_CAPTION_CHARS:
+                logger.info("Captions too short, Whisper will be used")
+                return None
+            
+            self.language = code
+            logger.info(f"Captions parsed: {len(segments)} segments, {len(transcript)} characters")
+            return transcript
+        
         except Exception as e:
-            logger.error(f"Failed to load Whisper model: {str(e)}")
-            logger.error(f"Error type: {type(e).__name__}")
-            # Try alternative loading method
-            try:
-                logger.info("Trying alternative Whisper loading...")
-                import torch
-                if torch.cuda.is_available():
-                    logger.info("CUDA available, using GPU")
-                    self.whisper_model = whisper.load_model("tiny", device="cuda")
-                else:
-                    logger.info("Using CPU")
-                    self.whisper_model = whisper.load_model("tiny", device="cpu")
-                logger.info("Whisper model loaded successfully with alternative method")
-            except Exception as e2:
-                logger.error(f"Alternative loading also failed: {str(e2)}")
-                self.whisper_model = None
+            logger.warning(f"Caption fetch failed, Whisper will be used: {str(e)}")
+            return None
+    
+    def stream_audio(self, url: str, info: Optional[dict] = None) -> Tuple[Optional[str], Optional[np.ndarray], Optional[str]]:
+        """
+        Decode the best audio stream straight to 16 kHz mono samples in memory
+        
+        yt-dlp only resolves the stream URL; ffmpeg reads it and writes raw PCM
+        to a pipe that is converted into one float32 buffer as it arrives, so
+        no audio file is written and Whisper gets the array directly.
+        
+        Returns:
+            Tuple of (video_title, samples, video_info)
+        """
+        try:
+            logger.info(f"Streaming audio from: {url}")
+            
+            ydl_opts = self._stream_options()
+            if info is None:
+                info = self.extract_info(url)
+            
+            video_title = info.get('title', 'Unknown Title')
+            duration = info.get('duration', 0)
+            
+            self.duration = duration
+            
+            # Check video duration (max 2 hours)
+            if duration > 7200:  # 2 hours in seconds
+                raise ValueError(f"Video too long ({duration//60} minutes). Maximum allowed: 2 hours")
+            
+            stream_url = info.get('url')
+            headers = info.get('http_headers') or {}
+            if not stream_url and info.get('requested_formats'):
+                stream_format = info['requested_formats'][0]
+                stream_url = stream_format.get('url')
+                headers = stream_format.get('http_headers') or headers
+            if not stream_url:
+                raise ValueError("No direct audio stream URL")
+            
+            cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-rw_timeout', str(STREAM_READ_TIMEOUT * 1000000)]
+            if headers:
+                cmd += ['-headers', ''.join(f"{k}: {v}\r\n" for k, v in headers.items())]
+            proxy = ydl_opts.get('proxy')
+            if proxy and proxy.startswith('http'):
+                cmd += ['-http_proxy', proxy]
+            cmd += [
+                '-i', stream_url,
+                '-vn',
+                '-f', 's16le',
+                '-acodec', 'pcm_s16le',
+                '-ar', '16000',  # 16kHz sample rate
+                '-ac', '1',      # Mono
+                '-'
+            ]
+            
+            # The metadata duration sizes the sample buffer up front
+            samples = read_pcm(cmd, expected_samples=int((duration or 0) + 1) * SAMPLE_RATE)
+            if samples.size == 0:
+                raise ValueError("Decoded audio is empty")
+            
+            logger.info(f"Streamed {samples.size / SAMPLE_RATE / 60:.1f} minutes of audio for: {video_title}")
+            return video_title, samples, f"Duration: {duration//60} minutes"
+        
+        except Exception as e:
+            logger.warning(f"Audio streaming failed: {str(e)}")
+            return None, None, str(e)
+    
+    def transcribe_samples(self, samples: np.ndarray) -> Optional[str]:
+        """Transcribe in-memory 16 kHz samples"""
+        try:
+            logger.info("Starting transcription...")
+            result = transcription_service.transcribe_segmented(samples)
+            
+            if not result["text"]:
+                logger.warning("Empty transcript generated")
+                logger.info("Retrying with different settings...")
+                result = transcription_service.transcribe_segmented(samples, language="en")
+            
+            transcript = result["text"]
+            self.language = result["language"]
+            
+            if not transcript:
+                raise ValueError("No transcript generated after retry")
+            
+            logger.info(f"Transcription completed. Length: {len(transcript)} characters")
+            return transcript
+        
+        except Exception as e:
+            logger.error(f"Transcription failed: {str(e)}")
+            return None
     
     def download_video(self, url: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
         """
@@ -62,52 +307,8 @@ class YouTubeProcessor:
             yt_cookies_browser = os.getenv('YT_COOKIES_FROM_BROWSER')  # e.g., 'chrome' | 'edge' | 'firefox'
             yt_cookies_file = os.getenv('YT_COOKIES_FILE')  # path to Netscape cookies.txt
 
-            # Configure yt-dlp options with robust network settings and anti-403 measures
-            ydl_opts = {
-                # Prefer m4a when available, then bestaudio, then best
-                'format': 'bestaudio[ext=m4a]/bestaudio/best',
-                'outtmpl': os.path.join(self.temp_dir, '%(title)s.%(ext)s'),
-                # Let yt-dlp extract audio via FFmpeg postprocessor
-                'postprocessors': [
-                    {
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'wav',
-                        'preferredquality': '192'
-                    }
-                ],
-                'prefer_ffmpeg': True,
-                'keepvideo': False,
-                'noplaylist': True,
-                'quiet': True,
-                'no_warnings': True,
-                'socket_timeout': 20,
-                'retries': 5,
-                'fragment_retries': 5,
-                'extractor_retries': 3,
-                'concurrent_fragment_downloads': 1,
-                'geo_bypass': True,
-                'geo_bypass_country': yt_geo,
-                'proxy': yt_proxy,
-                'retry_sleep_functions': {
-                    'http': lambda _: 2,
-                    'fragment': lambda _: 2
-                },
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
-                },
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': ['web']
-                    }
-                },
-                'nocheckcertificate': True,
-            }
-
-            # Attach cookies if provided
-            if yt_cookies_browser:
-                ydl_opts['cookiesfrombrowser'] = (yt_cookies_browser,)
-            elif yt_cookies_file and os.path.exists(yt_cookies_file):
-                ydl_opts['cookiefile'] = yt_cookies_file
+            ydl_opts = self._ydl_options()
+            ydl_opts['outtmpl'] = os.path.join(self.temp_dir, '%(title)s.%(ext)s')
             
             last_error: Optional[str] = None
             for attempt in range(1, 4):
@@ -118,6 +319,8 @@ class YouTubeProcessor:
                         video_title = info.get('title', 'Unknown Title')
                         duration = info.get('duration', 0)
                         
+                        self.duration = duration
+                        
                         # Check video duration (max 2 hours)
                         if duration > 7200:  # 2 hours in seconds
                             raise ValueError(f"Video too long ({duration//60} minutes). Maximum allowed: 2 hours")
@@ -192,9 +395,6 @@ class YouTubeProcessor:
             Transcribed text or None if failed
         """
         try:
-            if not self.whisper_model:
-                raise ValueError("Whisper model not loaded")
-            
             if not os.path.exists(audio_file_path):
                 raise ValueError(f"Audio file not found: {audio_file_path}")
             
@@ -210,28 +410,18 @@ class YouTubeProcessor:
             # Convert audio to WAV if needed
             wav_path = self._ensure_wav_format(audio_file_path)
             
-            # Transcribe the audio with verbose logging
+            # Transcribe the audio in warm Whisper workers (long audio is split across them)
             logger.info("Starting transcription...")
-            result = self.whisper_model.transcribe(
-                wav_path,
-                verbose=True,
-                language=None,  # Auto-detect language
-                fp16=False  # Disable fp16 for better compatibility
-            )
-            
-            transcript = result["text"].strip()
+            result = transcription_service.transcribe_segmented(wav_path)
             
-            if not transcript:
+            if not result["text"]:
                 logger.warning("Empty transcript generated")
                 # Try with different settings
                 logger.info("Retrying with different settings...")
-                result = self.whisper_model.transcribe(
-                    wav_path,
-                    verbose=True,
-                    language="en",  # Force English
-                    fp16=False
-                )
-                transcript = result["text"].strip()
+                result = transcription_service.transcribe(wav_path, language="en")
+            
+            transcript = result["text"]
+            self.language = result["language"]
             
             if not transcript:
                 raise ValueError("No transcript generated after retry")
@@ -287,17 +477,53 @@ class YouTubeProcessor:
             # Return original file if conversion fails
             return audio_file_path
     
-    def process_youtube_video(self, url: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    def process_youtube_video(self, url: str, language: Optional[str] = None) -> Tuple[Optional[str], Optional[str], Optional[str]]:
         """
         Complete YouTube video processing pipeline
         
+        Captions are used when available, Whisper otherwise.
+        
         Args:
             url: YouTube video URL
+            language: Preferred caption language
             
         Returns:
             Tuple of (video_title, transcript, video_info)
         """
         try:
+            info = None
+            try:
+                info = self.extract_info(url)
+            except Exception as e:
+                logger.warning(f"Video info extraction failed: {str(e)}")
+            
+            if info:
+                duration = info.get('duration') or 0
+                self.duration = duration
+                if duration > 7200:
+                    return None, None, f"Video too long ({duration//60} minutes). Maximum allowed: 2 hours"
+                
+                # Fastest path: the video already has captions
+                transcript = self.fetch_captions(info, language)
+                if transcript:
+                    self.source = "captions"
+                    record_transcript_source("captions")
+                    return info.get('title', 'Unknown Title'), transcript, f"Duration: {duration//60} minutes"
+            
+            # Fast path: decode audio into memory, no temp files
+            self.source = "whisper"
+            video_title, samples, video_info = self.stream_audio(url, info) if info else (None, None, None)
+            if samples is not None:
+                transcript = self.transcribe_samples(samples)
+                if not transcript:
+                    return video_title, None, "Transcription failed"
+                record_transcript_source("whisper")
+                return video_title, transcript, video_info
+            
+            if video_info and "too long" in video_info:
+                return None, None, video_info
+            
+            logger.info("Falling back to downloading the audio file")
             # Download video and extract audio
             video_title, audio_path, video_info = self.download_video(url)
             
@@ -310,6 +536,7 @@ class YouTubeProcessor:
             if not transcript:
                 return video_title, None, "Transcription failed"
             
+            record_transcript_source("whisper")
             return video_title, transcript, video_info
             
         except Exception as e:
@@ -332,12 +559,46 @@ class YouTubeProcessor:
         """Clean up temporary files"""
         try:
             import shutil
-            if os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-                logger.info(f"Cleaned up temp directory: {self.temp_dir}")
+            if self._temp_dir and os.path.exists(self._temp_dir):
+                shutil.rmtree(self._temp_dir)
+                logger.info(f"Cleaned up temp directory: {self._temp_dir}")
+                self._temp_dir = None
         except Exception as e:
             logger.error(f"Cleanup failed: {str(e)}")
     
     def __del__(self):
         """Destructor to ensure cleanup"""
         self.cleanup()
+
+
+def process_youtube_video(url: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Run the whole pipeline with a short-lived processor
+
+    Repeat videos are served from the transcript cache, videos with captions
+    skip Whisper entirely. Downloading happens
+    in the calling thread, transcription in the warm workers of the shared
+    transcription service.
+    """
+    cache = get_transcript_cache()
+    video_id = extract_video_id(url)
+    if video_id:
+        cached = cache.get(video_id)
+        if cached:
+            record_transcript_source("cache")
+            return cached["title"], cached["transcript"], cached["video_info"]
+    
+    processor = YouTubeProcessor()
+    try:
+        video_title, transcript, video_info = processor.process_youtube_video(url)
+        if video_id and video_title and transcript:
+            cache.put(
+                video_id, video_title, transcript,
+                language=processor.language,
+                duration=processor.duration,
+                model="captions" if processor.source == "captions" else transcription_service.model_size,
+                video_info=video_info
+            )
+        return video_title, transcript, video_info
+    finally:
+        processor.cleanup()
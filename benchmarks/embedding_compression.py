@@ -0,0 +1,75 @@
+"""
+Recall vs. size of truncated-dimension and float16/int8 embedding storage
+
+Vectors come from the embedding cache (real text-embedding-3-small chunks);
+the last ones are held out as queries. Every setting is searched with an
+exact Flat index and compared to the full float32 neighbours, so the
+numbers show what EMBEDDING_DIMENSIONS and VECTOR_STORAGE cost in recall.
+Without a cache, synthetic vectors with decaying per-dimension variance
+stand in; they only hint at the trade-off.
+
+Usage: python benchmarks/embedding_compression.py [embedding_cache.db] [vectors] [queries]
+"""
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG_bot"))
+
+from embedding_cache import EMBEDDING_MODEL, EmbeddingCache
+from index_factory import build_index, reduce_dimensions
+
+DIMENSIONS = (1536, 1024, 512, 256, 128)
+STORAGES = ("float32", "float16", "int8")
+K = 10
+
+
+def load_vectors(path: str, limit: int) -> np.ndarray:
+    if os.path.exists(path):
+        vectors = EmbeddingCache(path).sample(EMBEDDING_MODEL, limit)
+        if vectors:
+            print(f"{len(vectors)} cached {EMBEDDING_MODEL} vectors from {path}")
+            return np.asarray(vectors, dtype=np.float32)
+    print("No embedding cache found, using synthetic vectors")
+    rng = np.random.RandomState(0)
+    vectors = rng.randn(limit, 1536).astype(np.float32) / np.sqrt(np.arange(1, 1537, dtype=np.float32)) ** 0.5
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "./embedding_cache.db"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    vectors = load_vectors(path, count + queries)
+    base, held_out = vectors[:-queries], vectors[-queries:]
+    # Per-query latency, as the bot searches one question at a time
+    faiss.omp_set_num_threads(1)
+
+    _, truth = build_index({"type": "flat"}, base).search(held_out, K)
+    print(f"{len(base)} vectors, {len(held_out)} queries, recall@{K} against full float32\n")
+    print(f"{'dims':>5} {'storage':>8} {'bytes/vec':>10} {'index MB':>9} {'recall':>7} {'ms/query':>9}")
+    for dim in DIMENSIONS:
+        if dim > vectors.shape[1]:
+            continue
+        reduced_base = reduce_dimensions(base, dim)
+        reduced_queries = reduce_dimensions(held_out, dim)
+        for storage in STORAGES:
+            index = build_index({"type": "flat", "storage": storage}, reduced_base)
+            started = time.perf_counter()
+            _, found = index.search(reduced_queries, K)
+            elapsed = (time.perf_counter() - started) / len(reduced_queries) * 1000
+            size = len(faiss.serialize_index(index)) / 1024 / 1024
+            print(f"{dim:>5} {storage:>8} {index.sa_code_size():>10} {size:>9.1f} "
+                  f"{recall(found, truth):>7.3f} {elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
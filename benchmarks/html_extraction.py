@@ -0,0 +1,87 @@
+"""
+Throughput and extracted-token counts of article HTML extraction
+
+Compares the main-content extractor with the previous pipeline: the
+WebBaseLoader text (html.parser + get_text) cleaned once more by the old
+BeautifulSoup cleaner, and that cleaner run on the raw HTML.
+
+Usage: python benchmarks/html_extraction.py [fixtures_dir] [rounds]
+"""
+import os
+import sys
+import glob
+import time
+
+import bs4
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG_bot"))
+
+from content_extractor import extract_article
+from tokenizer_service import tokenizer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def baseline_clean_html(content: str) -> str:
+    """The previous html.parser cleaner with its fixed tag list"""
+    soup = bs4.BeautifulSoup(content, "html.parser")
+    for element in soup(["script", "style", "nav", "footer", "iframe", "aside", "header", "meta", "link"]):
+        element.decompose()
+    return soup.get_text(separator="\n", strip=True)
+
+
+def baseline_pipeline(html: str) -> str:
+    """WebBaseLoader's text extraction followed by the old cleaner (two parses)"""
+    text = bs4.BeautifulSoup(html, "html.parser").get_text()
+    return baseline_clean_html(text)
+
+
+EXTRACTORS = {
+    "webbaseloader+clean": baseline_pipeline,
+    "clean_html(raw)": baseline_clean_html,
+    "content_extractor": lambda html: extract_article(html)[1],
+}
+
+
+def run(pages: dict, rounds: int) -> dict:
+    total_bytes = sum(len(html.encode("utf-8")) for html in pages.values())
+    results = {}
+    for name, extract in EXTRACTORS.items():
+        best = float("inf")
+        for _ in range(rounds):
+            started = time.perf_counter()
+            texts = [extract(html) for html in pages.values()]
+            best = min(best, time.perf_counter() - started)
+        results[name] = {
+            "pages_per_second": len(pages) / best,
+            "mb_per_second": total_bytes / 1024 / 1024 / best,
+            "tokens": dict(zip(pages, tokenizer.count_batch(texts)))
+        }
+    return results
+
+
+def main():
+    fixtures_dir = sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    paths = sorted(glob.glob(os.path.join(fixtures_dir, "*.html")))
+    if not paths:
+        print(f"No .html fixtures in {fixtures_dir}")
+        sys.exit(1)
+    pages = {}
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages[os.path.basename(path)] = f.read()
+
+    results = run(pages, rounds)
+    print(f"{len(pages)} pages, best of {rounds} rounds\n")
+    print(f"{'extractor':<22}{'pages/s':>10}{'MB/s':>8}")
+    for name, result in results.items():
+        print(f"{name:<22}{result['pages_per_second']:>10.1f}{result['mb_per_second']:>8.2f}")
+    print("\nExtracted tokens per page")
+    print(f"{'page':<28}" + "".join(f"{name:>22}" for name in results))
+    for page in pages:
+        print(f"{page:<28}" + "".join(f"{r['tokens'][page]:>22}" for r in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Pages/second of sequential vs. multi-process PDF text extraction
+
+Usage: python benchmarks/pdf_extraction.py path/to/file.pdf [rounds]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG_bot"))
+
+from pdf_extractor import benchmark, pdf_extractor
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    try:
+        results = benchmark(sys.argv[1], rounds)
+    finally:
+        pdf_extractor.shutdown()
+    print(f"{results['pages']} pages, {results['workers']} workers")
+    print(f"sequential: {results['sequential']:8.1f} pages/s")
+    print(f"parallel:   {results['parallel']:8.1f} pages/s ({results['parallel'] / results['sequential']:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
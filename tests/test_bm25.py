@@ -0,0 +1,33 @@
+from bm25_index import BM25Index, tokenize
+
+DOCS = [(f"doc-{n}", f"chunk {n} about topic-{n % 7} with code ERR-{n} and common words") for n in range(40)]
+
+
+def _scores(index, query):
+    return {doc_id: round(score, 9) for doc_id, score in index.search(query, k=50)}
+
+
+def test_tokenize_keeps_compounds_and_parts():
+    assert tokenize("See ERR-42 now") == ["see", "err-42", "err", "42", "now"]
+
+
+def test_incremental_updates_match_a_rebuild():
+    index = BM25Index.build(DOCS[:30])
+    index.add(DOCS[30:])
+    removed = [doc for doc in DOCS if int(doc[0].split("-")[1]) % 3 == 0]
+    index.remove(removed)
+    kept = [doc for doc in DOCS if doc not in removed]
+    rebuilt = BM25Index.build(kept)
+    for query in ("topic-3", "ERR-12", "ERR-13", "common words", "chunk 20"):
+        assert _scores(index, query) == _scores(rebuilt, query)
+    assert "doc-12" not in _scores(index, "ERR-12")
+
+
+def test_removing_most_chunks_compacts_numbers(tmp_path):
+    index = BM25Index.build(DOCS)
+    index.remove(DOCS[:30])
+    assert index.ids == [doc_id for doc_id, _ in DOCS[30:]]
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert _scores(loaded, "topic-3") == _scores(BM25Index.build(DOCS[30:]), "topic-3")
+    assert loaded.is_confident("what is ERR-35", loaded.search("what is ERR-35"))
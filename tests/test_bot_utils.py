@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from bot_utils import TELEGRAM_MESSAGE_LIMIT, StreamingMessage, markdown_safe_cut
+
+
+class FakeMessage:
+    def __init__(self, sent):
+        self.sent = sent
+        self.text = ""
+        sent.append(self)
+
+    async def edit_text(self, text, parse_mode=None):
+        self.text = text
+
+    async def reply_text(self, text):
+        # A cut that makes no progress would roll over forever
+        assert len(self.sent) < 100, "too many messages"
+        message = FakeMessage(self.sent)
+        message.text = text
+        return message
+
+
+def _stream(answer, steps):
+    sent = []
+    stream = StreamingMessage(FakeMessage(sent), interval=0)
+
+    async def run():
+        for end in steps:
+            await stream.update(answer[:end])
+        await stream.finish(answer)
+
+    asyncio.run(asyncio.wait_for(run(), timeout=10))
+    return [message.text for message in sent]
+
+
+def test_cut_stops_before_open_code_block():
+    text = "intro\n```python\n" + "x = 1\n" * 10
+    assert markdown_safe_cut(text, 30) == len("intro\n")
+
+
+def test_long_code_block_is_split_across_messages():
+    code = "".join(f"print({n})\n" for n in range(2000))
+    answer = f"Here is the script:\n```python\n{code}```\nDone."
+    texts = _stream(answer, range(0, len(answer), 500))
+
+    assert len(texts) > 3
+    for text in texts:
+        assert len(text) <= TELEGRAM_MESSAGE_LIMIT
+        assert text.count("```") % 2 == 0
+    # Every continuation reopens the block with its language
+    assert all(text.startswith("```python\n") for text in texts[2:])
+    # Without the added fences the messages hold the whole answer
+    joined = texts[0]
+    for text in texts[1:]:
+        if joined.endswith("\n```") and text.startswith("```python\n"):
+            joined = joined[:-len("```")] + text[len("```python\n"):]
+        else:
+            joined += text
+    assert joined == answer
+
+
+def test_answer_without_code_is_split_at_line_breaks():
+    answer = "".join(f"Line number {n} of the answer.\n" for n in range(600))
+    texts = _stream(answer, [len(answer)])
+    assert len(texts) > 1
+    assert "".join(texts) == answer
@@ -0,0 +1,36 @@
+import numpy as np
+
+import index_factory
+from index_factory import INT8_MIN_VECTORS, RETRAIN_GROWTH, build_index, choose_index_spec, needs_rebuild
+
+DIM = 32
+
+
+def test_int8_waits_for_a_training_sample():
+    assert choose_index_spec(10, DIM, storage="int8")["storage"] == "float32"
+    spec = choose_index_spec(INT8_MIN_VECTORS, DIM, storage="int8")
+    assert spec["storage"] == "int8"
+    assert spec["trained_on"] == INT8_MIN_VECTORS
+
+
+def test_int8_is_retrained_as_the_corpus_grows(monkeypatch):
+    monkeypatch.setattr(index_factory, "choose_index_spec",
+                        lambda count, dim: choose_index_spec(count, dim, storage="int8"))
+    assert needs_rebuild(None, 10, DIM) is None
+    spec = needs_rebuild(None, INT8_MIN_VECTORS, DIM)
+    assert spec["storage"] == "int8"
+    assert needs_rebuild(spec, RETRAIN_GROWTH * INT8_MIN_VECTORS, DIM) is None
+    grown = needs_rebuild(spec, RETRAIN_GROWTH * INT8_MIN_VECTORS + 1, DIM)
+    assert grown["trained_on"] == RETRAIN_GROWTH * INT8_MIN_VECTORS + 1
+    # Manifests written before the training size was recorded get retrained once
+    assert needs_rebuild({"type": "flat", "storage": "int8"}, INT8_MIN_VECTORS, DIM) is not None
+
+
+def test_int8_recall_on_trained_ranges():
+    rng = np.random.RandomState(0)
+    vectors = rng.randn(INT8_MIN_VECTORS + 200, DIM).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    base, queries = vectors[:INT8_MIN_VECTORS], vectors[INT8_MIN_VECTORS:]
+    _, truth = build_index({"type": "flat"}, base).search(queries, 1)
+    _, found = build_index(choose_index_spec(len(base), DIM, storage="int8"), base).search(queries, 1)
+    assert np.mean(found[:, 0] == truth[:, 0]) > 0.9
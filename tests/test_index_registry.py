@@ -0,0 +1,118 @@
+import functools
+import hashlib
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import index_factory
+from index_registry import IndexRegistry
+
+DIM = 16
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic unit vectors derived from the text"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.RandomState(seed).randn(DIM).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+@pytest.fixture
+def ivfpq_registry(tmp_path, monkeypatch):
+    # Force IVF-PQ for small corpora: no memory for Flat or HNSW, and a low training minimum.
+    # Few subquantizers keep PQ training fast.
+    monkeypatch.setattr(index_factory, "IVFPQ_MIN_VECTORS", 500)
+    monkeypatch.setattr(index_factory, "_pq_subquantizers", lambda dim: 2)
+    monkeypatch.setattr(index_factory, "choose_index_spec",
+                        functools.partial(index_factory.choose_index_spec, budget_mb=0))
+    return IndexRegistry(root=str(tmp_path))
+
+
+def _add(registry, embeddings, source_id, count, start=0):
+    texts = [f"{source_id} chunk {n}" for n in range(start, start + count)]
+    vectors = embeddings.embed_documents(texts)
+    return registry.add_source(None, source_id, source_id, "text", texts, vectors,
+                               [{} for _ in texts], embeddings)
+
+
+def _search_all(registry, embeddings, texts):
+    from kb_store import load_store
+    store = load_store(registry.resolve(None), embeddings)
+    for text in texts:
+        docs = store.similarity_search_by_vector(embeddings.embed_query(text), k=4)
+        assert docs, text
+
+
+def test_ivfpq_remove_and_reingest(ivfpq_registry):
+    embeddings = HashEmbeddings()
+    _add(ivfpq_registry, embeddings, "a", 400)
+    _add(ivfpq_registry, embeddings, "b", 400)
+    assert ivfpq_registry._read(None)["index"]["type"] == "ivfpq"
+
+    assert ivfpq_registry.remove_source(None, "a", embeddings)
+    _search_all(ivfpq_registry, embeddings, [f"b chunk {n}" for n in (0, 200, 399)])
+
+    # Re-ingesting a source replaces its chunks without id collisions
+    _add(ivfpq_registry, embeddings, "b", 300)
+    _add(ivfpq_registry, embeddings, "c", 300)
+    manifest = ivfpq_registry._read(None)
+    assert manifest["index"]["type"] == "ivfpq"
+    assert set(manifest["sources"]) == {"b", "c"}
+
+    from kb_store import load_store
+    store = load_store(ivfpq_registry.resolve(None), embeddings)
+    assert store.index.ntotal == 600
+    assert sorted(store.index_to_docstore_id) == list(range(600))
+    _search_all(ivfpq_registry, embeddings, ["b chunk 5", "c chunk 299"])
+
+
+def test_keyword_index_follows_sources(tmp_path):
+    from bm25_index import BM25Index
+    from kb_store import load_store
+
+    registry = IndexRegistry(root=str(tmp_path))
+    embeddings = HashEmbeddings()
+    _add(registry, embeddings, "a", 30)
+    _add(registry, embeddings, "b", 30)
+    _add(registry, embeddings, "a", 20)
+    registry.remove_source(None, "b", embeddings)
+
+    keyword_index = BM25Index.load(registry.resolve(None))
+    rebuilt = BM25Index.from_vector_store(load_store(registry.resolve(None), embeddings))
+    assert sorted(doc_id for doc_id in keyword_index.ids if doc_id) == sorted(rebuilt.ids)
+    assert keyword_index.search("a chunk 7", k=3) == rebuilt.search("a chunk 7", k=3)
+    assert not keyword_index.search("b", k=3)
+
+
+def _add_sources(root, prefix):
+    registry = IndexRegistry(root=root)
+    embeddings = HashEmbeddings()
+    for n in range(4):
+        _add(registry, embeddings, f"{prefix}{n}", 40)
+
+
+def test_concurrent_writer_processes_keep_chunks_intact(tmp_path):
+    import multiprocessing
+    from kb_store import load_store
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_add_sources, args=(str(tmp_path), prefix)) for prefix in "pq"]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    registry = IndexRegistry(root=str(tmp_path))
+    assert len(registry.list_sources(None)) == 8
+    store = load_store(registry.resolve(None), HashEmbeddings())
+    assert store.index.ntotal == 8 * 40
+    for doc_id in store.index_to_docstore_id.values():
+        source_id, n = doc_id.rsplit("-", 1)
+        assert store.docstore.search(doc_id).page_content == f"{source_id} chunk {n}"
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from index_factory import build_index
+from kb_store import ArenaDocstore, load_store, save_store
+
+DIM = 16
+COUNT = 3000
+
+SPECS = [
+    {"type": "flat", "storage": "float32"},
+    {"type": "flat", "storage": "float16"},
+    {"type": "flat", "storage": "int8"},
+    {"type": "hnsw", "M": 8, "ef_search": 32, "storage": "float32"},
+    {"type": "hnsw", "M": 8, "ef_search": 32, "storage": "int8"},
+    {"type": "ivfpq", "nlist": 64, "m": 4, "nprobe": 8, "trained_on": COUNT},
+]
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.RandomState(0)
+    data = rng.randn(COUNT, DIM).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=lambda spec: f"{spec['type']}-{spec.get('storage', 'pq')}")
+@pytest.mark.parametrize("writable", [False, True], ids=["mmap", "writable"])
+def test_load_every_index_type(tmp_path, vectors, spec, writable):
+    ids = [f"doc-{i}" for i in range(COUNT)]
+    docstore = ArenaDocstore()
+    docstore.add({doc_id: Document(page_content=f"chunk {i}", metadata={"n": i}) for i, doc_id in enumerate(ids)})
+    store = FAISS(FakeEmbeddings(), build_index(spec, vectors), docstore, dict(enumerate(ids)))
+    save_store(store, str(tmp_path))
+
+    loaded = load_store(str(tmp_path), FakeEmbeddings(), writable=writable)
+    assert loaded.index.ntotal == COUNT
+    docs = loaded.similarity_search_by_vector(vectors[7].tolist(), k=5)
+    assert docs
+    assert "chunk 7" in [doc.page_content for doc in docs]
+
+
+def test_pickled_store_is_rejected(tmp_path):
+    (tmp_path / "index.faiss").write_bytes(b"")
+    (tmp_path / "index.pkl").write_bytes(b"not unpickled")
+    with pytest.raises(ValueError, match="Unsupported knowledge base"):
+        load_store(str(tmp_path), FakeEmbeddings())
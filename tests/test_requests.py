@@ -0,0 +1,13 @@
+from Requests import PROMPT_TEMPLATE, build_prompt
+
+
+def test_custom_prompt_is_added_to_the_default_template():
+    text = build_prompt("Answer in {technical} style", "What is X?", "Document 1:\nX is Y")
+    assert text.startswith("Expert Research Assistant Guidelines:")
+    assert "User Instructions:\nAnswer in {technical} style\n\nContext:\nDocument 1:\nX is Y" in text
+    assert text.endswith("Question: What is X?")
+
+
+def test_empty_prompt_uses_the_template_unchanged():
+    text = build_prompt("", "Q?", "C")
+    assert text == PROMPT_TEMPLATE.replace("{context}", "C").replace("{question}", "Q?")
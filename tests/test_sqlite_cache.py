@@ -0,0 +1,54 @@
+import time
+
+from sqlite_cache import SqliteLRUCache, process_wide
+
+
+class BlobCache(SqliteLRUCache):
+    TABLE = "blobs"
+    KEY = "key"
+
+    def __init__(self, path, max_bytes):
+        super().__init__(path, max_bytes, """
+            CREATE TABLE IF NOT EXISTS blobs (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+
+    def put(self, key, size):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (key, size, time.time()))
+            evicted = self._evict()
+            self._conn.commit()
+        return evicted
+
+    def get(self, key):
+        with self._lock:
+            found = self._conn.execute("SELECT 1 FROM blobs WHERE key = ?", (key,)).fetchone() is not None
+            if found:
+                self._touch(key)
+        return found
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = BlobCache(str(tmp_path / "blobs.db"), max_bytes=20)
+    assert cache.put("a", 8) == []
+    assert cache.put("b", 8) == []
+    assert cache.get("a")
+    assert cache.put("c", 8) == ["b"]
+    assert cache.get("a") and cache.get("c") and not cache.get("b")
+
+
+def test_entry_just_written_is_kept_even_if_too_large(tmp_path):
+    cache = BlobCache(str(tmp_path / "blobs.db"), max_bytes=10)
+    cache.put("a", 4)
+    assert cache.put("big", 50) == ["a"]
+    assert cache.get("big")
+
+
+def test_process_wide_creates_one_instance():
+    created = []
+    get = process_wide(lambda: created.append(object()) or created[-1])
+    assert get() is get()
+    assert len(created) == 1
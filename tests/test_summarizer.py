@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from summarizer import SummaryCache, Summarizer
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        return SimpleNamespace(content=f"notes {self.calls}")
+
+
+def test_second_summary_only_pays_for_cached_steps(tmp_path):
+    docs = [Document(page_content=f"paragraph {n} " * 200, metadata={"source_id": f"s{n % 2}"})
+            for n in range(12)]
+    cache = SummaryCache(str(tmp_path / "summaries.db"))
+    llm = FakeLLM()
+    summarizer = Summarizer(llm, model="test", cache=cache, batch_tokens=1000)
+    first = asyncio.run(summarizer.asummarize(docs, "Summarize: {text}"))
+    calls = llm.calls
+    assert first and calls > 1
+
+    again = Summarizer(llm, model="test", cache=cache, batch_tokens=1000)
+    assert asyncio.run(again.asummarize(docs, "Summarize: {text}")) == first
+    assert llm.calls == calls
+    assert again.stats["generated"] == 0
+
+
+
+def test_blocking_work_goes_through_run_io(tmp_path):
+    docs = [Document(page_content=f"paragraph {n} " * 300, metadata={"source_id": "s"}) for n in range(12)]
+    offloaded = []
+
+    async def run_io(fn, *args):
+        offloaded.append(getattr(fn, "__name__", fn))
+        return await asyncio.to_thread(fn, *args)
+
+    summarizer = Summarizer(FakeLLM(), model="test", cache=SummaryCache(str(tmp_path / "s.db")), batch_tokens=1000)
+    assert asyncio.run(summarizer.asummarize(docs, "Summarize: {text}", run_io=run_io))
+    assert {"_map_batches", "count_batch", "get", "put"} <= set(offloaded)
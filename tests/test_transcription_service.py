@@ -0,0 +1,30 @@
+import numpy as np
+
+import transcription_service
+from transcription_service import SAMPLE_RATE, TranscriptionService, split_on_silence, stitch_transcripts
+
+
+def test_default_runs_segmented_mode():
+    assert transcription_service.WHISPER_WORKERS >= 2
+
+
+def test_short_file_is_not_decoded_in_the_parent(monkeypatch):
+    service = TranscriptionService(workers=2)
+    calls = []
+    monkeypatch.setattr(transcription_service, "audio_duration", lambda path: 60.0)
+    monkeypatch.setattr(service, "transcribe", lambda audio, language=None: calls.append(audio) or {"text": "t"})
+    assert service.transcribe_segmented("/tmp/audio.wav")["text"] == "t"
+    assert calls == ["/tmp/audio.wav"]
+
+
+def test_split_on_silence_cuts_in_pauses():
+    rng = np.random.RandomState(0)
+    samples = rng.randn(SAMPLE_RATE * 100).astype(np.float32)
+    samples[SAMPLE_RATE * 45:SAMPLE_RATE * 46] = 0
+    bounds = split_on_silence(samples, max_seconds=50, search_seconds=10)
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(samples)
+    assert SAMPLE_RATE * 45 <= bounds[0][1] <= SAMPLE_RATE * 46
+
+
+def test_stitch_drops_overlap_words():
+    assert stitch_transcripts(["one two three", "Three four"]) == "one two three four"
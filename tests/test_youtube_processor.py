@@ -0,0 +1,53 @@
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from youtube_processor import read_pcm
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_read_pcm_converts_chunks_into_one_buffer(tmp_path):
+    pcm = (np.arange(200001) % 65536 - 32768).astype(np.int16)
+    path = tmp_path / "audio.pcm"
+    path.write_bytes(pcm.tobytes())
+    # Odd-sized writes split samples across reads
+    code = (f"import sys; data = open({str(path)!r}, 'rb').read(); "
+            "[sys.stdout.buffer.write(data[i:i + 777]) or sys.stdout.flush() for i in range(0, len(data), 777)]")
+    # A buffer sized too small is grown
+    samples = read_pcm(_python(code), expected_samples=1000)
+    assert samples.dtype == np.float32
+    np.testing.assert_array_equal(samples, pcm.astype(np.float32) / 32768.0)
+
+
+def test_read_pcm_reports_decoder_errors():
+    with pytest.raises(RuntimeError, match="decoding failed"):
+        read_pcm(_python("import sys; sys.stderr.write('bad input'); sys.exit(1)"))
+
+
+def test_read_pcm_gives_up_on_a_stalled_stream():
+    code = "import sys, time; sys.stdout.buffer.write(b'\\0' * 64); sys.stdout.flush(); time.sleep(30)"
+    with pytest.raises(RuntimeError, match="stalled"):
+        read_pcm(_python(code), read_timeout=0.5)
+
+
+def test_failed_whisper_run_is_not_counted(monkeypatch):
+    import youtube_processor
+
+    processor = youtube_processor.YouTubeProcessor()
+    monkeypatch.setattr(processor, "extract_info", lambda url: {"title": "t", "duration": 60})
+    monkeypatch.setattr(processor, "fetch_captions", lambda info, language=None: None)
+    monkeypatch.setattr(processor, "stream_audio", lambda url, info=None: ("t", np.zeros(16000, np.float32), "i"))
+    monkeypatch.setattr(processor, "transcribe_samples", lambda samples: None)
+    before = youtube_processor.get_transcript_source_stats().get("whisper", 0)
+    assert processor.process_youtube_video("https://youtu.be/abcdefghijk")[1] is None
+    assert youtube_processor.get_transcript_source_stats().get("whisper", 0) == before
+
+    monkeypatch.setattr(processor, "transcribe_samples", lambda samples: "text")
+    assert processor.process_youtube_video("https://youtu.be/abcdefghijk")[1] == "text"
+    assert youtube_processor.get_transcript_source_stats()["whisper"] == before + 1